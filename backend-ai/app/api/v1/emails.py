@@ -3,6 +3,7 @@ Endpoints para processamento de e-mails
 """
 
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+import uuid
 from typing import Optional, Dict, Any, List
 from loguru import logger
 
@@ -92,9 +93,6 @@ async def process_email_batch(
     Returns:
         Status do processamento em lote
     """
-    import uuid
-    from datetime import datetime
-    
     # Gera ID do job
     job_id = str(uuid.uuid4())
     
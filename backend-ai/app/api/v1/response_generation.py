@@ -3,6 +3,7 @@ Endpoints para geração de respostas de e-mail
 """
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from typing import Optional, Dict, Any
 from loguru import logger
 
@@ -29,6 +30,7 @@ router = APIRouter()
 async def generate_response(
     request: ResponseGenerationInput,
     save_to_db: bool = True,
+    wait_for_save: bool = True,
     api_key: str = Depends(verify_api_key)
 ) -> GeneratedResponse:
     """
@@ -46,6 +48,8 @@ async def generate_response(
     Args:
         request: Dados completos para geração da resposta
         save_to_db: Se deve salvar no banco (padrão: True)
+        wait_for_save: Se deve aguardar o salvamento antes de responder
+            (padrão: True). Com False, o salvamento roda em segundo plano
     
     Returns:
         Resposta gerada com sugestão de assunto e corpo
@@ -60,7 +64,8 @@ async def generate_response(
         # Gera resposta com Gemini
         result = await response_service.generate_response(
             request=request,
-            save_to_db=save_to_db
+            save_to_db=save_to_db,
+            wait_for_save=wait_for_save
         )
         
         logger.info(
@@ -79,6 +84,52 @@ async def generate_response(
         )
 
 
+@router.post(
+    "/generate-stream",
+    summary="Gerar resposta em streaming",
+    description="Gera resposta usando LLM e envia o JSON à medida que é produzido"
+)
+async def generate_response_stream(
+    request: ResponseGenerationInput,
+    api_key: str = Depends(verify_api_key)
+) -> StreamingResponse:
+    """
+    Gera resposta para e-mail enviando o texto do Gemini conforme chega
+    
+    O corpo concatenado é o mesmo JSON retornado por /generate. A resposta
+    não é salva no banco; use /generate quando precisar persistir.
+    
+    Args:
+        request: Dados completos para geração da resposta
+    
+    Returns:
+        Stream com o JSON da resposta gerada
+    """
+    logger.info(f"Streaming response for email {request.email_id}")
+    
+    stream = response_service.generate_response_stream(request)
+    
+    try:
+        # Obtém o primeiro pedaço antes de responder, para que erros iniciais
+        # (e-mail não relacionado, falha no Gemini) virem HTTP 500
+        first_chunk = await stream.__anext__()
+    except StopAsyncIteration:
+        first_chunk = ""
+    except Exception as e:
+        logger.error(f"Error streaming response: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao gerar resposta: {str(e)}"
+        )
+    
+    async def _body():
+        yield first_chunk
+        async for chunk in stream:
+            yield chunk
+    
+    return StreamingResponse(_body(), media_type="application/json")
+
+
 @router.post(
     "/generate-batch",
     response_model=BatchResponseGenerationResult,
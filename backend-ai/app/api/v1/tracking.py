@@ -97,7 +97,6 @@ async def query_tracking_batch(
     Returns:
         Resultado das buscas em lote
     """
-    import asyncio
     import time
     
     start_time = time.time()
@@ -105,45 +104,20 @@ async def query_tracking_batch(
     try:
         logger.info(f"Batch tracking query for {len(batch.queries)} items")
         
-        # Processa consultas em paralelo
-        tasks = [
-            mysql_service.query_tracking(
-                email_id=query.email_id,
-                sender_email=query.sender_email,
-                order_id=query.order_id
-            )
-            for query in batch.queries
-        ]
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Consultas sem order_id são agrupadas em uma única query no MySQL
+        results = await mysql_service.query_tracking_batch(batch.queries)
         
         # Processa resultados
-        valid_results = []
         found_count = 0
         
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.error(f"Batch query error for item {i}: {result}")
-                # Cria resultado de erro
-                valid_results.append(
-                    TrackingQueryResult(
-                        email_id=batch.queries[i].email_id,
-                        found=False,
-                        query_time_ms=0,
-                        data_source="mysql",
-                        error=str(result),
-                        saved_to_db=False
-                    )
-                )
-            else:
-                valid_results.append(result)
-                if result.found:
-                    found_count += 1
-                    
-                    # Salva no Supabase se solicitado
-                    if batch.save_to_db:
-                        await _save_tracking_to_supabase(result)
-                        result.saved_to_db = True
+        for result in results:
+            if result.found:
+                found_count += 1
+                
+                # Salva no Supabase se solicitado
+                if batch.save_to_db:
+                    await _save_tracking_to_supabase(result)
+                    result.saved_to_db = True
         
         processing_time_ms = int((time.time() - start_time) * 1000)
         
@@ -151,7 +125,7 @@ async def query_tracking_batch(
             total_queries=len(batch.queries),
             found_count=found_count,
             not_found_count=len(batch.queries) - found_count,
-            results=valid_results,
+            results=results,
             processing_time_ms=processing_time_ms
         )
         
@@ -191,75 +165,6 @@ async def test_mysql_connection(
         }
 
 
-@router.post(
-    "/insert-sample",
-    summary="Inserir dados de exemplo",
-    description="Insere dados de rastreamento de exemplo para testes"
-)
-async def insert_sample_tracking(
-    api_key: str = Depends(verify_api_key)
-) -> Dict[str, Any]:
-    """
-    Insere dados de exemplo no MySQL para testes
-    """
-    try:
-        # Dados de exemplo
-        sample_data = {
-            "customer_email": "teste@example.com",
-            "order_id": "PED-2025-TEST",
-            "tracking_code": "BR123456789BR",
-            "carrier": "Correios",
-            "status": "EM_TRANSITO",
-            "last_location": "São Paulo/SP",
-            "last_update": "2025-01-06T14:30:00",
-            "estimated_delivery": "2025-01-09T18:00:00",
-            "recipient_name": "Cliente Teste",
-            "delivery_address": "Rua Exemplo, 123 - São Paulo/SP",
-            "history": [
-                {
-                    "date": "2025-01-04T10:00:00",
-                    "status": "Postado",
-                    "location": "São Paulo/SP",
-                    "description": "Objeto postado"
-                },
-                {
-                    "date": "2025-01-05T14:00:00",
-                    "status": "Em trânsito",
-                    "location": "Curitiba/PR",
-                    "description": "Objeto em trânsito"
-                },
-                {
-                    "date": "2025-01-06T14:30:00",
-                    "status": "Em trânsito",
-                    "location": "São Paulo/SP",
-                    "description": "Objeto chegou na cidade de destino"
-                }
-            ]
-        }
-        
-        success = await mysql_service.insert_tracking_data(sample_data)
-        
-        if success:
-            return {
-                "success": True,
-                "message": "Dados de exemplo inseridos com sucesso",
-                "order_id": sample_data["order_id"],
-                "customer_email": sample_data["customer_email"]
-            }
-        else:
-            return {
-                "success": False,
-                "message": "Falha ao inserir dados de exemplo"
-            }
-            
-    except Exception as e:
-        logger.error(f"Error inserting sample data: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erro ao inserir dados de exemplo: {str(e)}"
-        )
-
-
 async def _save_tracking_to_supabase(result: TrackingQueryResult):
     """
     Salva resultado de rastreamento no Supabase
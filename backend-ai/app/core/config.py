@@ -29,6 +29,12 @@ class Settings(BaseSettings):
     GEMINI_TEMPERATURE: float = 0.0  # Most deterministic setting
     GEMINI_MAX_OUTPUT_TOKENS: int = 65000  # Máximo suportado pelo modelo
     GEMINI_TOP_P: float = 0.9
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = True  # Cache explícito do system prompt das respostas
+    GEMINI_CONTEXT_CACHE_TTL: int = 3600  # seconds
+    GEMINI_MAX_CONNECTIONS: int = 64
+    GEMINI_MAX_KEEPALIVE_CONNECTIONS: int = 32
+    GEMINI_KEEPALIVE_EXPIRY: float = 60.0  # seconds
+    MAX_BODY_CHARS: int = 8000  # Máximo de caracteres do corpo do e-mail enviados ao gerar respostas
     
     # Supabase Configuration
     SUPABASE_URL: str
@@ -46,6 +52,8 @@ class Settings(BaseSettings):
     MYSQL_CONNECT_TIMEOUT: int = 10  # Timeout de conexão em segundos
     MYSQL_READ_TIMEOUT: int = 30  # Timeout de leitura em segundos
     MYSQL_WRITE_TIMEOUT: int = 30  # Timeout de escrita em segundos
+    MYSQL_RETRY_MAX_DELAY: float = 30.0  # Teto do backoff entre tentativas em segundos
+    MYSQL_RECONNECT_MIN_INTERVAL: float = 5.0  # Intervalo mínimo entre reconexões do pool
     
     # Redis Configuration (for future async processing)
     REDIS_URL: Optional[str] = "redis://localhost:6379"
@@ -64,12 +72,18 @@ class Settings(BaseSettings):
     # Logging
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "json"
+    METRICS_FLUSH_INTERVAL: int = 5  # seconds
+    METRICS_FLUSH_SIZE: int = 1000  # registros acumulados antes de um resumo antecipado
     
     # Processing Settings
     MAX_CONCURRENT_REQUESTS: int = 10
+    CLASSIFICATION_BATCH_MAX_CONCURRENT: int = 5
+    RESPONSE_BATCH_MAX_CONCURRENT: int = 3  # Menos paralelo para geração de resposta
     PROCESSING_TIMEOUT: int = 30  # seconds
     ENABLE_RESPONSE_CACHE: bool = True
     CACHE_TTL: int = 300  # seconds
+    TRACKING_CACHE_TTL: int = 60  # seconds (consultas de rastreamento repetidas no MySQL)
+    SUPABASE_BATCH_INSERT_SIZE: int = 500  # Máximo de linhas por insert em lote
     
     # Security
     SECRET_KEY: str
@@ -5,6 +5,7 @@ Configuração e cliente do Google Gemini
 from google import genai
 from google.genai import types
 from typing import Optional, Dict, Any
+import httpx
 import json
 import os
 from loguru import logger
@@ -14,6 +15,25 @@ from .config import settings
 # Cliente global do Gemini
 gemini_client: Optional[genai.Client] = None
 
+# Prompt do usuário para análise de e-mails, preenchido com format_map. Sem
+# indentação: espaços no início das linhas só viram tokens de entrada a mais
+_USER_PROMPT_TEMPLATE = """
+Analise o seguinte e-mail:
+
+De: {from}
+Para: {to}
+Assunto: {subject}
+
+Corpo do e-mail:
+{body}
+
+Metadados:
+- Recebido em: {received_at}
+- Thread ID: {thread_id}
+- Prioridade: {priority}
+- Labels: {labels}
+"""
+
 
 def init_gemini_client() -> genai.Client:
     """
@@ -22,7 +42,20 @@ def init_gemini_client() -> genai.Client:
     global gemini_client
     
     try:
-        gemini_client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        # Pool de conexões compartilhado por todas as chamadas (keep-alive evita
+        # novo handshake TLS a cada requisição ao Gemini)
+        limits = httpx.Limits(
+            max_connections=settings.GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.GEMINI_KEEPALIVE_EXPIRY
+        )
+        gemini_client = genai.Client(
+            api_key=settings.GEMINI_API_KEY,
+            http_options=types.HttpOptions(
+                client_args={"limits": limits},
+                async_client_args={"limits": limits}
+            )
+        )
         logger.info(f"Cliente Gemini inicializado com modelo: {settings.GEMINI_MODEL}")
         return gemini_client
     except Exception as e:
@@ -40,6 +73,35 @@ def get_gemini_client() -> genai.Client:
     return gemini_client
 
 
+def extract_response_text(response) -> Optional[str]:
+    """
+    Extrai o texto de uma resposta do Gemini
+    
+    Usa response.text e, se vazio, o primeiro texto encontrado nos candidates.
+    Retorna None se a resposta não tiver texto.
+    """
+    text = getattr(response, 'text', None)
+    if text:
+        return text
+    
+    for candidate in getattr(response, 'candidates', None) or ():
+        content = getattr(candidate, 'content', None)
+        if not content:
+            continue
+        parts = getattr(content, 'parts', None)
+        if parts:
+            for part in parts:
+                text = getattr(part, 'text', None)
+                if text:
+                    return text
+        else:
+            text = getattr(content, 'text', None)
+            if text:
+                return text
+    
+    return None
+
+
 async def analyze_email_with_gemini(
     email_data: Dict[str, Any],
     system_prompt: str,
@@ -59,22 +121,17 @@ async def analyze_email_with_gemini(
     client = get_gemini_client()
     
     # Prepara o prompt do usuário
-    user_prompt = f"""
-    Analise o seguinte e-mail:
-    
-    De: {email_data.get('from_address', 'Desconhecido')}
-    Para: {email_data.get('to_address', 'Desconhecido')}
-    Assunto: {email_data.get('subject', 'Sem assunto')}
-    
-    Corpo do e-mail:
-    {email_data.get('body', '')}
-    
-    Metadados:
-    - Recebido em: {email_data.get('received_at', 'Desconhecido')}
-    - Thread ID: {email_data.get('thread_id', 'Nova conversa')}
-    - Prioridade: {email_data.get('metadata', {}).get('priority', 'normal')}
-    - Labels: {', '.join(email_data.get('metadata', {}).get('labels', []))}
-    """
+    metadata = email_data.get('metadata', {})
+    user_prompt = _USER_PROMPT_TEMPLATE.format_map({
+        'from': email_data.get('from_address', 'Desconhecido'),
+        'to': email_data.get('to_address', 'Desconhecido'),
+        'subject': email_data.get('subject', 'Sem assunto'),
+        'body': email_data.get('body', ''),
+        'received_at': email_data.get('received_at', 'Desconhecido'),
+        'thread_id': email_data.get('thread_id', 'Nova conversa'),
+        'priority': metadata.get('priority', 'normal'),
+        'labels': ', '.join(metadata.get('labels', []))
+    })
     
     try:
         # Configuração de geração
@@ -85,8 +142,10 @@ async def analyze_email_with_gemini(
             "response_mime_type": "application/json"
         }
         
-        # Gera resposta com system instruction e thinking mode
-        response = client.models.generate_content(
+        # Gera resposta com system instruction e thinking mode.
+        # Cliente assíncrono: não trava o event loop durante a chamada (permite
+        # que process_batch realmente sobreponha e-mails).
+        response = await client.aio.models.generate_content(
             model=model or settings.GEMINI_MODEL,
             contents=[
                 {"role": "user", "parts": [{"text": user_prompt}]}
@@ -163,24 +222,7 @@ async def analyze_email_with_gemini(
         )
         
         # Extrai e valida JSON da resposta com tratamento seguro
-        result_text = None
-        
-        # Primeiro tenta response.text
-        if hasattr(response, 'text') and response.text:
-            result_text = response.text
-        # Depois tenta via candidates
-        elif hasattr(response, 'candidates') and response.candidates:
-            for candidate in response.candidates:
-                if hasattr(candidate, 'content') and candidate.content:
-                    if hasattr(candidate.content, 'parts') and candidate.content.parts:
-                        for part in candidate.content.parts:
-                            if hasattr(part, 'text') and part.text:
-                                result_text = part.text
-                                break
-                    elif hasattr(candidate.content, 'text') and candidate.content.text:
-                        result_text = candidate.content.text
-                if result_text:
-                    break
+        result_text = extract_response_text(response)
         
         if not result_text:
             # Verifica se foi truncado por MAX_TOKENS
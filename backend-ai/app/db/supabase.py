@@ -3,7 +3,8 @@ Cliente Supabase para o backend AI
 """
 
 from supabase import create_client, Client
-from typing import Optional
+from postgrest import ReturnMethod
+from typing import Optional, Union, List
 from loguru import logger
 
 from ..core.config import settings
@@ -62,10 +63,12 @@ async def test_supabase_connection() -> bool:
 
 
 # Funções auxiliares para operações comuns
-def save_processed_email(email_data: dict) -> dict:
+def save_processed_email(email_data: Union[dict, List[dict]]) -> Union[dict, List[dict], None]:
     """
-    Salva um e-mail processado no banco
+    Salva um ou mais e-mails processados no banco
     Cria um novo registro a cada processamento (permite múltiplos processamentos do mesmo email)
+    
+    Uma lista de registros é enviada em um único insert em lote.
     """
     try:
         client = get_supabase()
@@ -74,6 +77,8 @@ def save_processed_email(email_data: dict) -> dict:
         # Cada processamento terá seu próprio ID único (UUID)
         result = client.table('processed_emails').insert(email_data).execute()
         
+        if isinstance(email_data, list):
+            return result.data or []
         return result.data[0] if result.data else None
         
     except Exception as e:
@@ -81,6 +86,26 @@ def save_processed_email(email_data: dict) -> dict:
         raise
 
 
+def save_tracking_requests(tracking_data: List[dict]) -> None:
+    """
+    Salva pedidos de rastreamento em um único insert em lote
+    
+    Usa return=minimal: ninguém lê as linhas inseridas, então o PostgREST não
+    precisa devolvê-las (e o cliente não precisa fazer parse da resposta).
+    """
+    try:
+        client = get_supabase()
+        
+        client.table('tracking_requests').insert(
+            tracking_data,
+            returning=ReturnMethod.minimal
+        ).execute()
+        
+    except Exception as e:
+        logger.error(f"Erro ao salvar pedidos de rastreamento: {e}")
+        raise
+
+
 def get_processed_email(email_id: str) -> Optional[dict]:
     """
     Busca um e-mail processado pelo ID
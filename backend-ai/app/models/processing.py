@@ -40,6 +40,7 @@ class TokenUsage(BaseModel):
     input_tokens: int = Field(0, ge=0, description="Tokens de entrada")
     output_tokens: int = Field(0, ge=0, description="Tokens de saída")
     thought_tokens: int = Field(0, ge=0, description="Tokens de pensamento")
+    cached_tokens: int = Field(0, ge=0, description="Tokens de entrada servidos pelo cache de contexto")
     total_tokens: int = Field(0, ge=0, description="Total de tokens")
 
 
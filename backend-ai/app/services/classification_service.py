@@ -4,10 +4,11 @@ Serviço de classificação de e-mails usando Google Gemini
 
 import time
 import os
+import asyncio
 from typing import Dict, Any, Optional, List
 from loguru import logger
 
-from ..core.gemini import get_gemini_client
+from ..core.gemini import get_gemini_client, extract_response_text
 from ..core.config import settings
 from ..models.classification import (
     EmailClassificationInput,
@@ -21,6 +22,29 @@ from google.genai import types
 import json
 
 
+# Parâmetros de geração da classificação (iguais para todas as chamadas)
+_GENERATION_CONFIG: Dict[str, Any] = {
+    "temperature": 0.0,  # Zero para máxima determinística
+    "top_p": 0.9,
+    "max_output_tokens": 500,
+    "response_mime_type": "application/json"
+}
+
+_THINKING_CONFIG = types.ThinkingConfig(
+    thinking_budget=-1  # Dynamic thinking mode
+)
+
+_SAFETY_SETTINGS = [
+    types.SafetySetting(category=category, threshold="BLOCK_NONE")
+    for category in (
+        "HARM_CATEGORY_HARASSMENT",
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_DANGEROUS_CONTENT"
+    )
+]
+
+
 class ClassificationService:
     """
     Serviço para classificar e-mails usando Gemini AI
@@ -28,6 +52,8 @@ class ClassificationService:
     
     def __init__(self):
         self.classification_prompt: Optional[str] = None
+        # Configuração de geração montada uma vez (o system prompt não muda)
+        self._generate_config: Optional[types.GenerateContentConfig] = None
     
     def _load_classification_prompt(self) -> str:
         """
@@ -53,6 +79,19 @@ class ClassificationService:
             logger.error(f"Failed to load classification prompt: {e}")
             raise
     
+    def _get_generate_config(self, system_prompt: str) -> types.GenerateContentConfig:
+        """
+        Retorna a configuração de geração, criando-a na primeira chamada
+        """
+        if self._generate_config is None:
+            self._generate_config = types.GenerateContentConfig(
+                system_instruction=system_prompt,
+                thinking_config=_THINKING_CONFIG,
+                safety_settings=_SAFETY_SETTINGS,
+                **_GENERATION_CONFIG
+            )
+        return self._generate_config
+    
     async def classify_email(
         self,
         email: EmailClassificationInput,
@@ -91,64 +130,16 @@ class ClassificationService:
             # Chama Gemini
             client = get_gemini_client()
             
-            generation_config = {
-                "temperature": 0.0,  # Zero para máxima determinística
-                "top_p": 0.9,
-                "max_output_tokens": 500,
-                "response_mime_type": "application/json"
-            }
-            
-            response = client.models.generate_content(
+            response = await client.aio.models.generate_content(
                 model=settings.GEMINI_MODEL,
                 contents=[
                     {"role": "user", "parts": [{"text": user_prompt}]}
                 ],
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,  # System instruction correta
-                    thinking_config=types.ThinkingConfig(
-                        thinking_budget=-1  # Dynamic thinking mode
-                    ),
-                    **generation_config,
-                    safety_settings=[
-                        {
-                            "category": "HARM_CATEGORY_HARASSMENT",
-                            "threshold": "BLOCK_NONE"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_HATE_SPEECH",
-                            "threshold": "BLOCK_NONE"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                            "threshold": "BLOCK_NONE"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                            "threshold": "BLOCK_NONE"
-                        }
-                    ]
-                )
+                config=self._get_generate_config(system_prompt)
             )
             
             # Parse resposta com tratamento seguro
-            result_text = None
-            
-            # Primeiro tenta response.text
-            if hasattr(response, 'text') and response.text:
-                result_text = response.text
-            # Depois tenta via candidates
-            elif hasattr(response, 'candidates') and response.candidates:
-                for candidate in response.candidates:
-                    if hasattr(candidate, 'content') and candidate.content:
-                        if hasattr(candidate.content, 'parts') and candidate.content.parts:
-                            for part in candidate.content.parts:
-                                if hasattr(part, 'text') and part.text:
-                                    result_text = part.text
-                                    break
-                        elif hasattr(candidate.content, 'text') and candidate.content.text:
-                            result_text = candidate.content.text
-                    if result_text:
-                        break
+            result_text = extract_response_text(response)
             
             if not result_text:
                 # Verifica se foi truncado por MAX_TOKENS
@@ -245,41 +236,45 @@ class ClassificationService:
         Returns:
             Resultado da classificação em lote
         """
-        import asyncio
         start_time = time.time()
         
         results = []
         successful = 0
         failed = 0
         
-        # Processa em paralelo com limite
-        MAX_CONCURRENT = 5
+        # Processa em paralelo com limite: assim que uma classificação termina,
+        # a próxima começa (sem esperar a mais lenta de um grupo)
+        semaphore = asyncio.Semaphore(settings.CLASSIFICATION_BATCH_MAX_CONCURRENT)
         
-        for i in range(0, len(emails), MAX_CONCURRENT):
-            batch = emails[i:i + MAX_CONCURRENT]
-            
-            # Processa batch em paralelo
-            batch_tasks = [
-                self.classify_email(email, save_to_db)
-                for email in batch
-            ]
-            
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-            
-            for result in batch_results:
-                if isinstance(result, Exception):
-                    failed += 1
-                    logger.error(f"Batch classification error: {result}")
+        async def _classify_one(email: EmailClassificationInput):
+            async with semaphore:
+                return await self.classify_email(email, save_to_db=False)
+        
+        batch_results = await asyncio.gather(
+            *[_classify_one(email) for email in emails],
+            return_exceptions=True
+        )
+        
+        # Classificações bem-sucedidas são salvas juntas, no final do lote
+        to_save: List[EmailClassificationResult] = []
+        rows: List[Dict[str, Any]] = []
+        
+        for email, result in zip(emails, batch_results):
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error(f"Batch classification error: {result}")
+            else:
+                results.append(result)
+                if not result.error:
+                    successful += 1
+                    if save_to_db:
+                        to_save.append(result)
+                        rows.append(self._row_from_result(email, result))
                 else:
-                    results.append(result)
-                    if not result.error:
-                        successful += 1
-                    else:
-                        failed += 1
-            
-            # Pequeno delay entre batches
-            if i + MAX_CONCURRENT < len(emails):
-                await asyncio.sleep(0.5)
+                    failed += 1
+        
+        if rows:
+            await asyncio.to_thread(self._save_batch_to_database, to_save, rows)
         
         processing_time_ms = int((time.time() - start_time) * 1000)
         
@@ -317,6 +312,34 @@ class ClassificationService:
         
         return metadata
     
+    def _row_from_result(
+        self,
+        email: EmailClassificationInput,
+        result: EmailClassificationResult
+    ) -> Dict[str, Any]:
+        """
+        Monta o registro da tabela processed_emails para uma classificação
+        """
+        return {
+            "email_id": email.email_id,
+            "from_address": email.from_address,
+            "to_address": email.to_address,
+            "subject": email.subject,
+            "body": email.body,
+            "thread_id": email.thread_id,
+            "received_at": email.received_at.isoformat(),
+            "is_support": result.is_support,
+            "is_tracking": result.is_tracking,
+            "classification_confidence": result.confidence,
+            "email_type": result.email_type,
+            "urgency": result.urgency,
+            "processing_time_ms": result.processing_time_ms,
+            "prompt_tokens": result.prompt_tokens,
+            "output_tokens": result.output_tokens,
+            "total_tokens": result.total_tokens,
+            "status": "classified"
+        }
+    
     async def _save_to_database(
         self,
         email: EmailClassificationInput,
@@ -328,38 +351,55 @@ class ClassificationService:
         try:
             supabase = get_supabase()
             
-            # Prepara dados para inserção
-            data = {
-                "email_id": email.email_id,
-                "from_address": email.from_address,
-                "to_address": email.to_address,
-                "subject": email.subject,
-                "body": email.body,
-                "thread_id": email.thread_id,
-                "received_at": email.received_at.isoformat(),
-                "is_support": result.is_support,
-                "is_tracking": result.is_tracking,
-                "classification_confidence": result.confidence,
-                "email_type": result.email_type,
-                "urgency": result.urgency,
-                "processing_time_ms": result.processing_time_ms,
-                "prompt_tokens": result.prompt_tokens,
-                "output_tokens": result.output_tokens,
-                "total_tokens": result.total_tokens,
-                "status": "classified"
-            }
-            
-            # Insere ou atualiza
-            response = supabase.table("processed_emails").upsert(
-                data,
-                on_conflict="email_id"
-            ).execute()
+            # Insere ou atualiza (cliente síncrono: roda fora do event loop)
+            await asyncio.to_thread(
+                supabase.table("processed_emails").upsert(
+                    self._row_from_result(email, result),
+                    on_conflict="email_id"
+                ).execute
+            )
             
             logger.info(f"Classification saved to database for email {email.email_id}")
             
         except Exception as e:
             logger.error(f"Failed to save classification to database: {e}")
             raise
+    
+    def _save_batch_to_database(
+        self,
+        results: List[EmailClassificationResult],
+        rows: List[Dict[str, Any]]
+    ):
+        """
+        Salva as classificações de um lote no Supabase com upserts em lote
+        
+        Envia até SUPABASE_BATCH_INSERT_SIZE linhas por requisição e marca
+        saved_to_db nos resultados de cada lote salvo. Falhas são logadas.
+        """
+        supabase = get_supabase()
+        batch_size = settings.SUPABASE_BATCH_INSERT_SIZE
+        
+        # O upsert em lote falha se o mesmo email_id aparecer duas vezes na
+        # mesma requisição; mantém só a última classificação de cada e-mail
+        latest: Dict[str, int] = {row["email_id"]: i for i, row in enumerate(rows)}
+        if len(latest) < len(rows):
+            keep = sorted(latest.values())
+            results = [results[i] for i in keep]
+            rows = [rows[i] for i in keep]
+        
+        for i in range(0, len(rows), batch_size):
+            try:
+                supabase.table("processed_emails").upsert(
+                    rows[i:i + batch_size],
+                    on_conflict="email_id"
+                ).execute()
+                for result in results[i:i + batch_size]:
+                    result.saved_to_db = True
+            except Exception as e:
+                logger.error(f"Failed to save {len(rows[i:i + batch_size])} batch classification(s) to database: {e}")
+        
+        saved = sum(1 for result in results if result.saved_to_db)
+        logger.info(f"{saved} batch classification(s) saved to database")
 
 
 # Instância singleton do serviço
@@ -134,13 +134,45 @@ class CostService:
         Returns:
             Dicionário com custos detalhados em USD e BRL
         """
+        # Obtém taxa de câmbio atual
+        exchange_rate = await currency_service.get_exchange_rate()
+        return self._build_costs(token_usage, model_name, exchange_rate)
+    
+    def calculate_costs_cached(
+        self,
+        token_usage: TokenUsage,
+        model_name: str = "gemini-2.5-flash"
+    ) -> Dict[str, Any]:
+        """
+        Calcula custos com a última taxa de câmbio conhecida, sem await
+        
+        Usado no caminho de cada requisição: a taxa é mantida atualizada em
+        segundo plano pelo currency_service.
+        """
+        return self._build_costs(token_usage, model_name, currency_service.get_current_rate())
+    
+    def _build_costs(
+        self,
+        token_usage: TokenUsage,
+        model_name: str,
+        exchange_rate: float
+    ) -> Dict[str, Any]:
+        """
+        Monta o dicionário de custos para uma taxa de câmbio já conhecida
+        """
         # Obtém preços do modelo
         pricing = self.get_model_pricing(model_name)
         
-        # Calcula custos em USD
+        # Calcula custos em USD; tokens vindos do cache de contexto fazem parte
+        # dos tokens de entrada, mas são cobrados com o preço reduzido do cache
+        input_price = pricing.get("input_per_million", 0.30)
+        cached_tokens = min(token_usage.cached_tokens, token_usage.input_tokens)
         cost_input_usd = self.calculate_token_cost_usd(
-            token_usage.input_tokens,
-            pricing.get("input_per_million", 0.30)
+            token_usage.input_tokens - cached_tokens,
+            input_price
+        ) + self.calculate_token_cost_usd(
+            cached_tokens,
+            pricing.get("cache_context_per_million", input_price)
         )
         
         cost_output_usd = self.calculate_token_cost_usd(
@@ -155,9 +187,6 @@ class CostService:
         
         cost_total_usd = cost_input_usd + cost_output_usd + cost_thinking_usd
         
-        # Obtém taxa de câmbio atual
-        exchange_rate = await currency_service.get_exchange_rate()
-        
         # Converte para BRL
         cost_input_brl = currency_service.convert_usd_to_brl(cost_input_usd, exchange_rate)
         cost_output_brl = currency_service.convert_usd_to_brl(cost_output_usd, exchange_rate)
@@ -184,6 +213,7 @@ class CostService:
                 "input": token_usage.input_tokens,
                 "output": token_usage.output_tokens,
                 "thinking": token_usage.thought_tokens,
+                "cached": token_usage.cached_tokens,
                 "total": token_usage.total_tokens
             },
             "pricing_usd_per_million": pricing,
@@ -209,12 +239,14 @@ class CostService:
         total_input = sum(t.input_tokens for t in batch_tokens)
         total_output = sum(t.output_tokens for t in batch_tokens)
         total_thinking = sum(t.thought_tokens for t in batch_tokens)
+        total_cached = sum(t.cached_tokens for t in batch_tokens)
         
         # Cria TokenUsage agregado
         aggregated_usage = TokenUsage(
             input_tokens=total_input,
             output_tokens=total_output,
             thought_tokens=total_thinking,
+            cached_tokens=total_cached,
             total_tokens=total_input + total_output + total_thinking
         )
         
@@ -19,6 +19,8 @@ class CurrencyService:
         self._cache: Dict[str, Any] = {}
         self._cache_duration = timedelta(hours=1)  # Cache por 1 hora
         self._fallback_rate = 5.50  # Taxa de fallback caso API falhe
+        # Atualização periódica da taxa em segundo plano (iniciada no startup)
+        self._refresh_task: Optional[asyncio.Task] = None
         
         # APIs de câmbio gratuitas (em ordem de preferência)
         self._api_endpoints = [
@@ -165,6 +167,49 @@ class CurrencyService:
             return self._cache.get("rate")
         return None
     
+    def get_current_rate(self) -> float:
+        """
+        Retorna a última taxa conhecida, sem requisição e sem await
+        
+        Com a atualização em segundo plano ativa, é a taxa do cache; antes da
+        primeira consulta, é a taxa de fallback.
+        """
+        return self._cache.get("rate", self._fallback_rate)
+    
+    def start_refresh(self) -> None:
+        """
+        Inicia a atualização periódica da taxa em segundo plano (startup)
+        """
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    async def _refresh_loop(self) -> None:
+        """
+        Atualiza a taxa pouco antes de o cache expirar, fora das requisições
+        """
+        interval = max(self._cache_duration.total_seconds() - 300, 60)
+        while True:
+            try:
+                await self.get_exchange_rate(force_refresh=True)
+                delay = interval
+            except Exception as e:
+                # Uma falha não pode encerrar a tarefa: tenta de novo em breve
+                logger.error(f"Error refreshing exchange rate in background: {e}")
+                delay = 60
+            await asyncio.sleep(delay)
+    
+    async def stop_refresh(self) -> None:
+        """
+        Para a atualização periódica da taxa (shutdown)
+        """
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+    
     def get_cache_info(self) -> Dict[str, Any]:
         """
         Retorna informações sobre o cache atual
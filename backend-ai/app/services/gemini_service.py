@@ -3,6 +3,7 @@ Serviço de integração com Google Gemini
 """
 
 import time
+import asyncio
 from typing import Dict, Any, Optional, List
 from loguru import logger
 
@@ -167,8 +168,6 @@ class GeminiService:
         Returns:
             Lista de resultados
         """
-        import asyncio
-        
         results = []
         
         # Processa em lotes para evitar rate limit
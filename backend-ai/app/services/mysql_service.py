@@ -1,11 +1,25 @@
 """
 Serviço para consulta de dados de rastreamento no MySQL
+
+As consultas filtram por email_client e ordenam por purchase_date (o filtro
+de tracking é aplicado às linhas lidas). Para que a ordenação saia do próprio
+índice, sem filesort, e o LIMIT pare cedo, a tabela orders deve ter:
+
+    CREATE INDEX idx_email_purchase_date
+        ON orders(email_client, purchase_date DESC);
+
+Timeouts de sessão não são mais definidos por conexão (init_command). Configure
+no servidor MySQL (my.cnf ou parameter group do provedor):
+
+    wait_timeout = 28800
+    interactive_timeout = 28800
 """
 
 import aiomysql
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Final, Tuple
 from datetime import datetime
-import json
+import time
+import random
 import asyncio
 from functools import wraps
 from loguru import logger
@@ -16,9 +30,59 @@ from ..models.tracking import (
     TrackingStatus,
     TrackingCarrier,
     TrackingHistoryItem,
+    TrackingQueryInput,
     TrackingQueryResult
 )
 
+# Índice composto usado pelas consultas de rastreamento (ver docstring do módulo).
+# tracking fica de fora: o filtro `tracking > ''` é um intervalo e, como coluna
+# anterior a purchase_date, impediria a ordenação pelo índice
+TRACKING_INDEX_NAME = "idx_email_purchase_date"
+TRACKING_INDEX_DDL = (
+    "CREATE INDEX idx_email_purchase_date "
+    "ON orders(email_client, purchase_date DESC)"
+)
+
+# `tracking > ''` equivale a `tracking IS NOT NULL AND tracking != ''`
+_SELECT_ORDERS = """
+    SELECT /*+ INDEX(orders idx_email_purchase_date) */
+           id, order_id_cartpanda, `order`, email_client, 
+           tracking, purchase_date, status_id, financial_status,
+           payment_status, country, note
+    FROM orders 
+"""
+
+_SELECT_TRACKING_BY_EMAIL = _SELECT_ORDERS + """
+    WHERE email_client = %s
+    AND tracking > ''
+    ORDER BY purchase_date DESC
+    LIMIT %s
+"""
+
+_SELECT_TRACKING_BY_ORDER = _SELECT_ORDERS + """
+    WHERE email_client = %s 
+    AND (order_id_cartpanda = %s OR `order` = %s)
+    AND tracking > ''
+    ORDER BY purchase_date DESC
+    LIMIT 1
+"""
+
+# Recebe os placeholders do IN via str.format
+_SELECT_TRACKING_BY_EMAILS = _SELECT_ORDERS + """
+    WHERE email_client IN ({placeholders})
+    AND tracking > ''
+    ORDER BY email_client, purchase_date DESC
+"""
+
+# Sugestões retornadas quando nenhum rastreamento é encontrado. Só evita
+# repetir o texto nos pontos de uso: o campo List[str] de TrackingQueryResult
+# copia a tupla para uma lista nova a cada validação
+_NOT_FOUND_SUGGESTIONS: Final[Tuple[str, ...]] = (
+    "Verifique se o e-mail está correto",
+    "O pedido pode estar em processamento",
+    "Entre em contato com o suporte para mais informações"
+)
+
 
 def mysql_retry(max_attempts: int = 3, delay: float = 1.0):
     """
@@ -26,7 +90,7 @@ def mysql_retry(max_attempts: int = 3, delay: float = 1.0):
     
     Args:
         max_attempts: Número máximo de tentativas
-        delay: Delay inicial entre tentativas (cresce exponencialmente)
+        delay: Delay inicial entre tentativas (cresce exponencialmente, com jitter)
     """
     def decorator(func):
         @wraps(func)
@@ -42,7 +106,15 @@ def mysql_retry(max_attempts: int = 3, delay: float = 1.0):
                     if error_code in (2006, 2013, 2014):
                         last_exception = e
                         if attempt < max_attempts - 1:
-                            wait_time = delay * (2 ** attempt)  # Backoff exponencial
+                            self = args[0] if args else None
+                            failed_pool = getattr(self, 'pool', None)
+                            
+                            # Backoff exponencial com jitter para evitar reconexões em massa
+                            base = delay * (2 ** attempt)
+                            wait_time = min(
+                                random.uniform(base * 0.5, base * 1.5),
+                                getattr(settings, 'MYSQL_RETRY_MAX_DELAY', 30.0)
+                            )
                             logger.warning(
                                 f"MySQL connection error (attempt {attempt + 1}/{max_attempts}): {e}. "
                                 f"Retrying in {wait_time:.1f}s..."
@@ -50,9 +122,8 @@ def mysql_retry(max_attempts: int = 3, delay: float = 1.0):
                             await asyncio.sleep(wait_time)
                             
                             # Tenta reinicializar o pool se necessário
-                            self = args[0] if args else None
                             if self and hasattr(self, '_reconnect_pool'):
-                                await self._reconnect_pool()
+                                await self._reconnect_pool(failed_pool)
                         else:
                             logger.error(f"MySQL connection failed after {max_attempts} attempts: {e}")
                             raise
@@ -79,6 +150,7 @@ class MySQLService:
     def __init__(self):
         self.pool: Optional[aiomysql.Pool] = None
         self._lock = asyncio.Lock()  # Para evitar múltiplas reinicializações simultâneas
+        self._last_reconnect_ts: float = 0.0  # time.monotonic() da última reconexão
         
     async def initialize(self):
         """
@@ -91,6 +163,8 @@ class MySQLService:
             write_timeout = getattr(settings, 'MYSQL_WRITE_TIMEOUT', 30)
             pool_recycle = getattr(settings, 'MYSQL_POOL_RECYCLE', 3600)  # 1 hora
             
+            # Conexões mortas são tratadas por mysql_retry (erros 2006/2013),
+            # então as consultas não fazem ping antes de cada execução
             self.pool = await aiomysql.create_pool(
                 host=settings.MYSQL_HOST,
                 port=settings.MYSQL_PORT,
@@ -104,8 +178,7 @@ class MySQLService:
                 charset='utf8mb4',
                 cursorclass=aiomysql.DictCursor,
                 connect_timeout=connect_timeout,
-                echo=False,  # Mude para True para debug
-                init_command=f"SET SESSION wait_timeout=28800, interactive_timeout=28800"  # 8 horas
+                echo=False  # Mude para True para debug
             )
             logger.info(
                 f"MySQL pool initialized for database: {settings.MYSQL_DATABASE} "
@@ -119,11 +192,31 @@ class MySQLService:
             logger.error(f"Failed to initialize MySQL pool: {e}")
             raise
     
-    async def _reconnect_pool(self):
+    async def _reconnect_pool(self, stale_pool: Optional[aiomysql.Pool] = None):
         """
         Reinicializa o pool de conexões de forma segura
+        
+        Usa double-checked locking: se o pool já foi recriado por outra
+        corrotina enquanto esta aguardava o lock, retorna sem reconectar.
+        
+        Args:
+            stale_pool: Pool que apresentou falha (padrão: pool atual)
         """
+        old_pool = stale_pool if stale_pool is not None else self.pool
+        
         async with self._lock:
+            if self.pool is not old_pool and self.pool and not self.pool.closed:
+                logger.debug("MySQL pool already reconnected by another task")
+                return
+            
+            min_interval = getattr(settings, 'MYSQL_RECONNECT_MIN_INTERVAL', 5.0)
+            if (
+                self.pool and not self.pool.closed
+                and time.monotonic() - self._last_reconnect_ts < min_interval
+            ):
+                logger.debug("MySQL pool reconnected recently, skipping")
+                return
+            
             logger.info("Attempting to reconnect MySQL pool...")
             try:
                 # Fecha o pool antigo se existir
@@ -134,6 +227,7 @@ class MySQLService:
                 
                 # Reinicializa o pool
                 await self.initialize()
+                self._last_reconnect_ts = time.monotonic()
                 logger.info("MySQL pool reconnected successfully")
             except Exception as e:
                 logger.error(f"Failed to reconnect MySQL pool: {e}")
@@ -159,7 +253,8 @@ class MySQLService:
     
     async def _ensure_table_exists(self):
         """
-        Verifica se a tabela orders existe (não cria mais tabela nova)
+        Verifica se a tabela orders e o índice de rastreamento existem
+        (não cria mais tabela nova)
         """
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
@@ -173,6 +268,18 @@ class MySQLService:
                     logger.info("Orders table exists and is ready")
                 else:
                     logger.warning("Orders table not found in database")
+                    return
+                
+                # Verifica o índice composto usado nas consultas de rastreamento
+                await cursor.execute(
+                    "SHOW INDEX FROM orders WHERE Key_name = %s",
+                    (TRACKING_INDEX_NAME,)
+                )
+                if not await cursor.fetchall():
+                    logger.warning(
+                        f"Index {TRACKING_INDEX_NAME} not found on orders table - "
+                        f"tracking queries will filesort. Create it with: {TRACKING_INDEX_DDL}"
+                    )
     
     @mysql_retry(max_attempts=3, delay=1.0)
     async def find_tracking_by_email(
@@ -190,43 +297,22 @@ class MySQLService:
         Returns:
             TrackingData se encontrado, None caso contrário
         """
-        # Garante que o pool está válido
-        await self._ensure_connection()
+        # Garante que o pool está válido (fast path sem await no estado normal)
+        pool = self.pool
+        if pool is None or pool.closed:
+            await self._ensure_connection()
+            pool = self.pool
         
         try:
-            async with self.pool.acquire() as conn:
-                # Testa a conexão antes de usar (ping)
-                await conn.ping()
-                
+            async with pool.acquire() as conn:
                 async with conn.cursor() as cursor:
                     # Prepara query para tabela orders
                     if order_id:
-                        query = """
-                            SELECT id, order_id_cartpanda, `order`, email_client, 
-                                   tracking, purchase_date, status_id, financial_status,
-                                   payment_status, country, note
-                            FROM orders 
-                            WHERE email_client = %s 
-                            AND (order_id_cartpanda = %s OR `order` = %s)
-                            AND tracking IS NOT NULL 
-                            AND tracking != ''
-                            ORDER BY purchase_date DESC
-                            LIMIT 1
-                        """
+                        query = _SELECT_TRACKING_BY_ORDER
                         params = (email, order_id, order_id)
                     else:
-                        query = """
-                            SELECT id, order_id_cartpanda, `order`, email_client, 
-                                   tracking, purchase_date, status_id, financial_status,
-                                   payment_status, country, note
-                            FROM orders 
-                            WHERE email_client = %s
-                            AND tracking IS NOT NULL 
-                            AND tracking != ''
-                            ORDER BY purchase_date DESC
-                            LIMIT 1
-                        """
-                        params = (email,)
+                        query = _SELECT_TRACKING_BY_EMAIL
+                        params = (email, 1)
                     
                     await cursor.execute(query, params)
                     result = await cursor.fetchone()
@@ -256,26 +342,16 @@ class MySQLService:
         Returns:
             Lista de TrackingData
         """
-        # Garante que o pool está válido
-        await self._ensure_connection()
+        # Garante que o pool está válido (fast path sem await no estado normal)
+        pool = self.pool
+        if pool is None or pool.closed:
+            await self._ensure_connection()
+            pool = self.pool
         
         try:
-            async with self.pool.acquire() as conn:
-                # Testa a conexão antes de usar (ping)
-                await conn.ping()
-                
+            async with pool.acquire() as conn:
                 async with conn.cursor() as cursor:
-                    query = """
-                        SELECT id, order_id_cartpanda, `order`, email_client, 
-                               tracking, purchase_date, status_id, financial_status,
-                               payment_status, country, note
-                        FROM orders 
-                        WHERE email_client = %s
-                        AND tracking IS NOT NULL 
-                        AND tracking != ''
-                        ORDER BY purchase_date DESC
-                        LIMIT %s
-                    """
+                    query = _SELECT_TRACKING_BY_EMAIL
                     
                     await cursor.execute(query, (email, limit))
                     results = await cursor.fetchall()
@@ -284,24 +360,68 @@ class MySQLService:
                     
         except Exception as e:
             logger.error(f"Error querying multiple trackings: {e}")
-            return []
+            raise
     
-    async def insert_tracking_data(
+    @mysql_retry(max_attempts=3, delay=1.0)
+    async def find_tracking_by_emails(
         self,
-        tracking_data: Dict[str, Any]
-    ) -> bool:
+        emails: List[str],
+        limit_per_email: int = 1
+    ) -> Dict[str, List[TrackingData]]:
         """
-        Método deprecado - mantido apenas para compatibilidade
-        A tabela orders já contém os dados de rastreamento
+        Busca rastreamentos de vários clientes em uma única query
         
         Args:
-            tracking_data: Dados de rastreamento
+            emails: Lista de e-mails dos clientes
+            limit_per_email: Máximo de rastreamentos por e-mail (padrão: 1)
             
         Returns:
-            False sempre (não insere mais dados)
+            Dicionário e-mail em minúsculas -> lista de TrackingData (mais
+            recentes primeiro). E-mails sem resultado não aparecem no dicionário.
         """
-        logger.warning("insert_tracking_data is deprecated - orders table already contains tracking data")
-        return False
+        if not emails:
+            return {}
+        
+        # Garante que o pool está válido (fast path sem await no estado normal)
+        pool = self.pool
+        if pool is None or pool.closed:
+            await self._ensure_connection()
+            pool = self.pool
+        
+        # Todas as grafias distintas vão para o IN (a collation da coluna
+        # pode diferenciar maiúsculas); o agrupamento é por e-mail em minúsculas
+        requested = tuple(dict.fromkeys(emails))
+        placeholders = ','.join(['%s'] * len(requested))
+        
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    query = _SELECT_TRACKING_BY_EMAILS.format(placeholders=placeholders)
+                    
+                    await cursor.execute(query, requested)
+                    results = await cursor.fetchall()
+            
+            # Agrupa por e-mail em minúsculas sem depender da ordem do SQL: com
+            # collation que diferencia maiúsculas, grafias do mesmo e-mail vêm
+            # em blocos separados. A ordenação estável por data junta os blocos
+            # e mantém a ordem do SQL quando só há uma grafia
+            grouped: Dict[str, List[Dict[str, Any]]] = {}
+            for row in results:
+                grouped.setdefault(str(row['email_client']).lower(), []).append(row)
+            
+            trackings: Dict[str, List[TrackingData]] = {}
+            for key, rows in grouped.items():
+                rows.sort(key=lambda row: row.get('purchase_date') or datetime.min, reverse=True)
+                trackings[key] = [
+                    self._parse_tracking_data_from_orders(row)
+                    for row in rows[:limit_per_email]
+                ]
+            
+            return trackings
+                    
+        except Exception as e:
+            logger.error(f"Error querying trackings for {len(emails)} emails: {e}")
+            raise
     
     def _parse_tracking_data_from_orders(self, row: Dict[str, Any]) -> TrackingData:
         """
@@ -339,18 +459,20 @@ class MySQLService:
             elif len(tracking_code) == 12 and tracking_code.isdigit():
                 carrier = TrackingCarrier.MERCADO_ENVIOS
         
+        # Os valores vêm do schema conhecido da tabela orders, então os
+        # modelos são construídos sem validação (model_construct)
         # Cria histórico simplificado baseado na data de compra
         history = []
         if row.get('purchase_date'):
-            history.append(TrackingHistoryItem(
+            history.append(TrackingHistoryItem.model_construct(
                 date=row['purchase_date'],
                 status='Pedido processado',
                 location=row.get('country', 'Brasil'),
                 description=f"Pedido {row.get('order_id_cartpanda', '')} processado"
             ))
         
-        return TrackingData(
-            order_id=row.get('order_id_cartpanda', row.get('order', '')),
+        return TrackingData.model_construct(
+            order_id=str(row.get('order_id_cartpanda', row.get('order', ''))),
             tracking_code=tracking_code,
             carrier=carrier,
             status=status,
@@ -366,77 +488,6 @@ class MySQLService:
             confidence=1.0
         )
     
-    def _parse_tracking_data(self, row: Dict[str, Any]) -> TrackingData:
-        """
-        Converte resultado do banco em TrackingData
-        
-        Args:
-            row: Linha do resultado MySQL
-            
-        Returns:
-            TrackingData object
-        """
-        # Parse histórico JSON
-        history = []
-        if row.get('tracking_json'):
-            try:
-                history_data = json.loads(row['tracking_json'])
-                for item in history_data:
-                    history.append(TrackingHistoryItem(
-                        date=datetime.fromisoformat(item['date']) if isinstance(item['date'], str) else item['date'],
-                        status=item.get('status', ''),
-                        location=item.get('location'),
-                        description=item.get('description')
-                    ))
-            except Exception as e:
-                logger.warning(f"Failed to parse tracking history: {e}")
-        
-        # Mapeia status do banco para enum
-        status = TrackingStatus.NAO_ENCONTRADO
-        if row.get('status'):
-            try:
-                status = TrackingStatus(row['status'])
-            except ValueError:
-                logger.warning(f"Unknown tracking status: {row['status']}")
-        
-        # Mapeia transportadora
-        carrier = TrackingCarrier.OUTRO
-        if row.get('carrier'):
-            try:
-                carrier = TrackingCarrier(row['carrier'])
-            except ValueError:
-                # Tenta encontrar por nome similar
-                carrier_map = {
-                    'correios': TrackingCarrier.CORREIOS,
-                    'mercado': TrackingCarrier.MERCADO_ENVIOS,
-                    'loggi': TrackingCarrier.LOGGI,
-                    'total': TrackingCarrier.TOTAL_EXPRESS,
-                    'jadlog': TrackingCarrier.JADLOG,
-                    'sequoia': TrackingCarrier.SEQUOIA
-                }
-                carrier_lower = row['carrier'].lower()
-                for key, value in carrier_map.items():
-                    if key in carrier_lower:
-                        carrier = value
-                        break
-        
-        return TrackingData(
-            order_id=row['order_id'],
-            tracking_code=row['tracking_code'] or '',
-            carrier=carrier,
-            status=status,
-            last_update=row['last_update'] or datetime.now(),
-            last_location=row.get('last_location'),
-            estimated_delivery=row.get('estimated_delivery'),
-            delivered_at=row.get('delivered_at'),
-            history=history,
-            recipient_name=row.get('recipient_name'),
-            recipient_document=row.get('recipient_document'),
-            delivery_address=row.get('delivery_address'),
-            source='mysql',
-            confidence=1.0
-        )
-    
     async def query_tracking(
         self,
         email_id: str,
@@ -454,12 +505,11 @@ class MySQLService:
         Returns:
             TrackingQueryResult com dados ou indicação de não encontrado
         """
-        import time
-        start_time = time.time()
+        start_ns = time.monotonic_ns()
         
         try:
             tracking_data = await self.find_tracking_by_email(sender_email, order_id)
-            query_time_ms = int((time.time() - start_time) * 1000)
+            query_time_ms = (time.monotonic_ns() - start_ns) // 1_000_000
             
             if tracking_data:
                 return TrackingQueryResult(
@@ -472,25 +522,19 @@ class MySQLService:
                 )
             else:
                 # Não encontrado, retorna sugestões
-                suggestions = [
-                    "Verifique se o e-mail está correto",
-                    "O pedido pode estar em processamento",
-                    "Entre em contato com o suporte para mais informações"
-                ]
-                
                 return TrackingQueryResult(
                     email_id=email_id,
                     found=False,
                     tracking_data=None,
                     query_time_ms=query_time_ms,
                     data_source='mysql',
-                    suggestions=suggestions,
+                    suggestions=_NOT_FOUND_SUGGESTIONS,
                     saved_to_db=False
                 )
                 
         except Exception as e:
             logger.error(f"Error in query_tracking: {e}")
-            query_time_ms = int((time.time() - start_time) * 1000)
+            query_time_ms = (time.monotonic_ns() - start_ns) // 1_000_000
             
             return TrackingQueryResult(
                 email_id=email_id,
@@ -502,6 +546,79 @@ class MySQLService:
                 saved_to_db=False
             )
     
+    async def query_tracking_batch(
+        self,
+        queries: List[TrackingQueryInput]
+    ) -> List[TrackingQueryResult]:
+        """
+        Consulta rastreamentos em lote
+        
+        Consultas sem order_id são resolvidas com uma única query
+        (find_tracking_by_emails); as demais seguem por query_tracking.
+        
+        Args:
+            queries: Lista de consultas
+            
+        Returns:
+            Lista de TrackingQueryResult na mesma ordem das consultas
+        """
+        start_ns = time.monotonic_ns()
+        
+        by_email = [q for q in queries if not q.order_id]
+        trackings: Dict[str, List[TrackingData]] = {}
+        error: Optional[str] = None
+        
+        if by_email:
+            try:
+                trackings = await self.find_tracking_by_emails(
+                    [q.sender_email for q in by_email]
+                )
+            except Exception as e:
+                logger.error(f"Error in query_tracking_batch: {e}")
+                error = str(e)
+        
+        query_time_ms = (time.monotonic_ns() - start_ns) // 1_000_000
+        
+        # Consultas com order_id continuam individuais, mas em paralelo
+        by_order = iter(await asyncio.gather(*[
+            self.query_tracking(
+                email_id=q.email_id,
+                sender_email=q.sender_email,
+                order_id=q.order_id
+            )
+            for q in queries if q.order_id
+        ]))
+        
+        results: List[TrackingQueryResult] = []
+        for query in queries:
+            if query.order_id:
+                results.append(next(by_order))
+                continue
+            
+            found = trackings.get(query.sender_email.lower())
+            if found:
+                results.append(TrackingQueryResult(
+                    email_id=query.email_id,
+                    found=True,
+                    tracking_data=found[0],
+                    query_time_ms=query_time_ms,
+                    data_source='mysql',
+                    saved_to_db=False
+                ))
+            else:
+                results.append(TrackingQueryResult(
+                    email_id=query.email_id,
+                    found=False,
+                    tracking_data=None,
+                    query_time_ms=query_time_ms,
+                    data_source='mysql',
+                    error=error,
+                    suggestions=() if error else _NOT_FOUND_SUGGESTIONS,
+                    saved_to_db=False
+                ))
+        
+        return results
+    
     @mysql_retry(max_attempts=2, delay=0.5)
     async def test_connection(self) -> bool:
         """
@@ -511,9 +628,12 @@ class MySQLService:
             True se conectou com sucesso
         """
         try:
-            await self._ensure_connection()
+            pool = self.pool
+            if pool is None or pool.closed:
+                await self._ensure_connection()
+                pool = self.pool
             
-            async with self.pool.acquire() as conn:
+            async with pool.acquire() as conn:
                 # Faz ping na conexão
                 await conn.ping()
                 
@@ -5,12 +5,17 @@ Integra classificação e busca de rastreamento
 
 import time
 import re
-from typing import Optional, Dict, Any, List
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 from loguru import logger
 
+from ..core.config import settings
 from ..core.gemini import analyze_email_with_gemini
-from ..db.supabase import save_processed_email
+from ..db.supabase import save_processed_email, save_tracking_requests
 from ..models.email import EmailInput
+from ..models.tracking import TrackingData
 from ..models.processing import (
     EmailClassification,
     TrackingInfo,
@@ -22,20 +27,43 @@ from .mysql_service import mysql_service
 from .cost_service import cost_service
 
 
-class ProcessingService:
-    """
-    Serviço unificado para processar e-mails
-    """
-    
-    def __init__(self):
-        self.classification_prompt = None
-    
-    def _get_classification_prompt(self) -> str:
-        """
-        Retorna o prompt para classificação de e-mails
-        """
-        if self.classification_prompt is None:
-            self.classification_prompt = """
+# Padrões de ID de pedido compilados uma única vez em uma alternação.
+# Os grupos p1..p6 seguem a ordem de prioridade (p1 = mais confiável).
+# A alternação fica dentro de um lookahead (largura zero): o finditer tenta
+# todas as posições sem consumir texto, então um match de baixa prioridade
+# (ex.: "Meupedido" em p6) não engole o início de um de alta ("pedido 12345").
+# p5/p6 não sofrem backtracking catastrófico: \b rejeita inícios no meio de uma
+# sequência e o quantificador limitado ({8,12}/{8,15}) tenta no máximo alguns
+# tamanhos por início, então a varredura é linear mesmo com longas sequências
+# de dígitos. Mantenha "pedido" como primeira alternativa (a mais frequente).
+# Só as palavras-chave ignoram maiúsculas (flag inline); o texto não precisa
+# de lower() e o restante do padrão evita o caminho case-insensitive do re.
+_ORDER_ID_RE = re.compile(
+    r"(?=(?:"
+    r"(?i:pedido)\s*#?\s*(?P<p1>\d{5,})"            # Pedido #12345
+    r"|(?i:order)\s*#?\s*(?P<p2>\d{5,})"           # Order #12345
+    r"|(?i:código)\s*:\s*(?P<p3>\w{8,})"           # Código: ABC12345
+    r"|(?i:rastreamento)\s*:\s*(?P<p4>\w{8,})"     # Rastreamento: XYZ789
+    r"|\b(?P<p5>\d{8,12})\b"                       # Números longos isolados
+    r"|\b(?P<p6>[A-Za-z0-9]{8,15})\b"              # Códigos alfanuméricos
+    r"))"
+)
+
+# Menor match possível entre os padrões acima (p5/p6: 8 caracteres)
+_ORDER_ID_MIN_LEN = 8
+
+# IDs de pedido quase sempre aparecem no início do e-mail (assunto/primeira tela)
+ORDER_ID_SEARCH_CHARS = 4096
+
+# Palavras que indicam rastreamento no formato antigo de resposta (decision/reason)
+_LEGACY_TRACKING_WORDS = ("tracking", "rastreamento", "pedido", "entrega", "order", "status")
+
+# Chaves de usage_metadata devolvidas por analyze_email_with_gemini
+_USAGE_KEYS = ("prompt_tokens", "output_tokens", "thought_tokens", "total_tokens")
+
+
+# Prompt padrão de classificação (constante, sem interpolação)
+_CLASSIFICATION_PROMPT: str = """
 Você é um assistente de classificação de e-mails para suporte ao cliente da empresa Biofraga.
 
 PRODUTOS COMERCIALIZADOS:
@@ -77,30 +105,119 @@ Responda APENAS em formato JSON válido:
     "extracted_order_id": "string ou null"
 }
 """
-        return self.classification_prompt
+
+
+def _to_tracking_info(tracking: TrackingData) -> TrackingInfo:
+    """
+    Converte um registro de rastreamento do MySQL para o formato da resposta
+    
+    Os campos já vêm tipados do TrackingData, então não há nova validação.
+    """
+    return TrackingInfo.model_construct(
+        order_id=tracking.order_id,
+        tracking_code=tracking.tracking_code,
+        purchase_date=tracking.last_update,
+        status=tracking.status.value if tracking.status else None
+    )
+
+
+class ProcessingService:
+    """
+    Serviço unificado para processar e-mails
+    """
+    
+    # Máximo de classificações mantidas no cache em memória
+    CLASSIFICATION_CACHE_SIZE = 2048
+    # Máximo de buscas de rastreamento mantidas no cache em memória
+    TRACKING_CACHE_SIZE = 2048
+    
+    def __init__(self):
+        # Cache LRU com TTL: chave -> (expira_em, resultado do Gemini)
+        self._classification_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Cache LRU com TTL: (remetente, order_id) -> (expira_em, resultado da busca)
+        self._tracking_cache: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, TrackingResult]]" = OrderedDict()
+        # Salvamentos em segundo plano ainda em andamento (evita coleta pelo GC)
+        self._pending_saves: "set[asyncio.Task]" = set()
     
     def _extract_order_id_from_text(self, text: str) -> Optional[str]:
         """
         Tenta extrair ID de pedido do texto do e-mail
         """
-        # Padrões comuns de ID de pedido
-        patterns = [
-            r'pedido\s*#?\s*(\d{5,})',  # Pedido #12345
-            r'order\s*#?\s*(\d{5,})',    # Order #12345
-            r'código\s*:\s*(\w{8,})',    # Código: ABC12345
-            r'rastreamento\s*:\s*(\w{8,})',  # Rastreamento: XYZ789
-            r'\b(\d{8,12})\b',           # Números longos isolados
-            r'\b([A-Z0-9]{8,15})\b'      # Códigos alfanuméricos
-        ]
+        # Nenhum padrão casa menos de _ORDER_ID_MIN_LEN caracteres
+        if len(text) < _ORDER_ID_MIN_LEN:
+            return None
+        
+        # Uma única varredura; entre os matches, vence o padrão de maior
+        # prioridade e, dentro dele, o mais à esquerda (como um search por padrão)
+        best = None
+        for match in _ORDER_ID_RE.finditer(text):
+            if best is None or match.lastgroup < best.lastgroup:
+                best = match
+                if best.lastgroup == "p1":
+                    break
         
-        text_lower = text.lower()
-        for pattern in patterns:
-            match = re.search(pattern, text_lower, re.IGNORECASE)
-            if match:
-                return match.group(1).upper()
+        if best:
+            return best.group(best.lastgroup).upper()
         
         return None
     
+    async def _classify_cached(
+        self,
+        email_data: Dict[str, Any],
+        prompt: str
+    ) -> Dict[str, Any]:
+        """
+        Classifica o e-mail com Gemini, reaproveitando resultados recentes
+        
+        E-mails idênticos (webhook reenviado, auto-resposta em loop, newsletter
+        em massa) dentro de CACHE_TTL segundos não geram nova chamada ao Gemini.
+        Em um acerto de cache o uso de tokens é zerado, pois nada foi consumido.
+        """
+        if not settings.ENABLE_RESPONSE_CACHE:
+            return await analyze_email_with_gemini(
+                email_data=email_data,
+                system_prompt=prompt,
+                model=None
+            )
+        
+        key = hashlib.blake2b(
+            "\x00".join((
+                prompt,
+                email_data.get("from_address") or "",
+                email_data.get("subject") or "",
+                email_data.get("body") or ""
+            )).encode("utf-8"),
+            digest_size=16
+        ).hexdigest()
+        
+        now = time.monotonic()
+        cached = self._classification_cache.get(key)
+        if cached and cached[0] > now:
+            self._classification_cache.move_to_end(key)
+            logger.info("Classification cache hit, skipping Gemini call")
+            return {
+                **cached[1],
+                "usage_metadata": {
+                    "prompt_tokens": 0,
+                    "output_tokens": 0,
+                    "thought_tokens": 0,
+                    "total_tokens": 0
+                }
+            }
+        
+        result = await analyze_email_with_gemini(
+            email_data=email_data,
+            system_prompt=prompt,
+            model=None
+        )
+        
+        self._classification_cache[key] = (now + settings.CACHE_TTL, result)
+        self._classification_cache.move_to_end(key)
+        while len(self._classification_cache) > self.CLASSIFICATION_CACHE_SIZE:
+            self._classification_cache.popitem(last=False)
+        
+        return result
+    
     async def process_email(
         self,
         email: EmailInput,
@@ -116,46 +233,72 @@ Responda APENAS em formato JSON válido:
         Returns:
             Resposta unificada do processamento
         """
-        start_time = time.time()
+        response, email_record, tracking_record = await self._process_email(email, custom_prompt)
+        
+        self._schedule_save(
+            [email_record],
+            [tracking_record] if tracking_record else []
+        )
+        
+        return response
+    
+    async def _process_email(
+        self,
+        email: EmailInput,
+        custom_prompt: Optional[str] = None
+    ) -> Tuple[EmailProcessingResponse, Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Classifica e busca rastreamento, sem salvar no banco
+        
+        Returns:
+            Tupla (resposta, registro para processed_emails,
+            registro para tracking_requests ou None)
+        """
+        start_ns = time.perf_counter_ns()
         
         try:
             # Fase 1: Classificação via Gemini
             logger.info(f"Processing email {email.email_id} from {email.from_address}")
             
+            # Data de recebimento serializada uma única vez (usada em email_data e email_record)
+            received_at_iso = email.received_at.isoformat() if email.received_at else None
+            
             # Prepara dados do e-mail
             email_data = {
                 "from_address": email.from_address,
                 "to_address": email.to_address,
                 "subject": email.subject,
                 "body": email.body,
-                "received_at": email.received_at.isoformat() if email.received_at else None
+                "received_at": received_at_iso
             }
             
             # Usa prompt de classificação
-            prompt = custom_prompt or self._get_classification_prompt()
+            prompt = custom_prompt or _CLASSIFICATION_PROMPT
             
-            # Classifica com Gemini
-            gemini_result = await analyze_email_with_gemini(
-                email_data=email_data,
-                system_prompt=prompt,
-                model=None
-            )
+            # Classifica com Gemini (ou reaproveita classificação recente idêntica)
+            gemini_result = await self._classify_cached(email_data, prompt)
             
             # Parse da classificação
             classification = self._parse_classification(gemini_result)
             
-            # Se não encontrou order_id na classificação, tenta extrair do texto
-            if not classification.extracted_order_id:
-                full_text = f"{email.subject} {email.body}"
-                classification.extracted_order_id = self._extract_order_id_from_text(full_text)
+            # Se não encontrou order_id na classificação, tenta extrair do texto.
+            # Só interessa para rastreamento; os demais e-mails pulam o regex.
+            if classification.is_tracking and not classification.extracted_order_id:
+                classification.extracted_order_id = self._extract_order_id_from_text(
+                    email.subject + " " + email.body[:ORDER_ID_SEARCH_CHARS]
+                )
             
             # Extrai tokens usados
-            usage_metadata = gemini_result.get("usage_metadata", {})
-            tokens = TokenUsage(
-                input_tokens=usage_metadata.get("prompt_tokens", 0),
-                output_tokens=usage_metadata.get("output_tokens", 0),
-                thought_tokens=usage_metadata.get("thought_tokens", 0),
-                total_tokens=usage_metadata.get("total_tokens", 0)
+            usage_get = gemini_result.get("usage_metadata", {}).get
+            prompt_tokens, output_tokens, thought_tokens, total_tokens = (
+                usage_get(key, 0) or 0 for key in _USAGE_KEYS
+            )
+            # Contagens já são inteiros vindos do SDK; dispensa a validação
+            tokens = TokenUsage.model_construct(
+                input_tokens=prompt_tokens,
+                output_tokens=output_tokens,
+                thought_tokens=thought_tokens,
+                total_tokens=total_tokens
             )
             
             # Fase 2: Busca de rastreamento se necessário
@@ -168,15 +311,15 @@ Responda APENAS em formato JSON válido:
                 )
             
             # Calcula tempo total
-            processing_time = time.time() - start_time
+            processing_time = (time.perf_counter_ns() - start_ns) / 1e9
             
             # Calcula custos do processamento
-            costs = await cost_service.calculate_costs(
+            costs = cost_service.calculate_costs_cached(
                 token_usage=tokens,
                 model_name="gemini-2.5-flash"
             )
             
-            # Salva email processado no banco de dados
+            # Registro para a tabela processed_emails
             email_record = {
                 "email_id": email.email_id,
                 "from_address": email.from_address,
@@ -184,7 +327,7 @@ Responda APENAS em formato JSON válido:
                 "subject": email.subject,
                 "body": email.body,
                 "thread_id": email.thread_id,
-                "received_at": email.received_at.isoformat() if email.received_at else None,
+                "received_at": received_at_iso,
                 "is_support": classification.is_support,
                 "is_tracking": classification.is_tracking,
                 "classification_confidence": float(classification.confidence),
@@ -209,47 +352,31 @@ Responda APENAS em formato JSON válido:
                 "status": "processed"
             }
             
-            try:
-                save_processed_email(email_record)
-                logger.info(f"Email {email.email_id} saved to processed_emails table")
-                
-                # Se foi rastreamento, salva também na tabela tracking_requests
-                if classification.is_tracking and tracking_result:
-                    from ..db.supabase import get_supabase
-                    supabase = get_supabase()
-                    
-                    tracking_record = {
-                        "email_id": email.email_id,
-                        "sender_email": email.from_address,
-                        "order_id": classification.extracted_order_id,
-                        "mysql_queried": tracking_result.found,
-                        "query_success": tracking_result.found,
-                        "tracking_details": {
-                            "found": tracking_result.found,
-                            "orders": [
-                                {
-                                    "order_id": order.order_id,
-                                    "tracking_code": order.tracking_code,
-                                    "status": order.status,
-                                    "purchase_date": order.purchase_date.isoformat() if order.purchase_date else None,
-                                    "customer_email": order.customer_email
-                                } for order in tracking_result.orders
-                            ] if tracking_result.orders else []
-                        }
+            # Se foi rastreamento, gera também o registro para tracking_requests
+            tracking_record = None
+            if classification.is_tracking and tracking_result:
+                tracking_record = {
+                    "email_id": email.email_id,
+                    "sender_email": email.from_address,
+                    "order_id": classification.extracted_order_id,
+                    "mysql_queried": tracking_result.found,
+                    "query_success": tracking_result.found,
+                    "tracking_details": {
+                        "found": tracking_result.found,
+                        "orders": [
+                            {
+                                "order_id": order.order_id,
+                                "tracking_code": order.tracking_code,
+                                "status": order.status,
+                                "purchase_date": order.purchase_date.isoformat() if order.purchase_date else None,
+                                "customer_email": email.from_address  # Pedidos buscados pelo remetente
+                            } for order in tracking_result.orders
+                        ] if tracking_result.orders else []
                     }
-                    
-                    try:
-                        supabase.table("tracking_requests").insert(tracking_record).execute()
-                        logger.info(f"Tracking request saved for email {email.email_id}")
-                    except Exception as tracking_error:
-                        logger.error(f"Failed to save tracking request: {tracking_error}")
-                        
-            except Exception as db_error:
-                logger.error(f"Failed to save email {email.email_id} to database: {db_error}")
-                # Continue processing even if save fails (non-critical)
+                }
             
             # Retorna resposta unificada
-            return EmailProcessingResponse(
+            response = EmailProcessingResponse(
                 email_id=email.email_id,
                 classification=classification,
                 tracking_data=tracking_result,
@@ -257,44 +384,125 @@ Responda APENAS em formato JSON válido:
                 processing_time=processing_time
             )
             
+            return response, email_record, tracking_record
+            
         except Exception as e:
             logger.error(f"Error processing email {email.email_id}: {e}")
             # Re-raise the exception to let the API handle it properly
             raise
     
+    def _schedule_save(
+        self,
+        email_records: List[Dict[str, Any]],
+        tracking_records: List[Dict[str, Any]]
+    ):
+        """
+        Agenda o salvamento dos registros sem bloquear a resposta
+        
+        O cliente Supabase é síncrono, então o salvamento roda em uma thread;
+        o chamador recebe o resultado sem esperar pelos inserts.
+        """
+        task = asyncio.create_task(
+            asyncio.to_thread(self._save_records, email_records, tracking_records)
+        )
+        self._pending_saves.add(task)
+        task.add_done_callback(self._pending_saves.discard)
+    
+    async def flush_pending_saves(self):
+        """
+        Aguarda os salvamentos em segundo plano (usado no shutdown)
+        """
+        if self._pending_saves:
+            logger.info(f"Waiting for {len(self._pending_saves)} pending save(s)...")
+            await asyncio.gather(*self._pending_saves, return_exceptions=True)
+    
+    def _save_records(
+        self,
+        email_records: List[Dict[str, Any]],
+        tracking_records: List[Dict[str, Any]]
+    ):
+        """
+        Salva e-mails processados e pedidos de rastreamento no Supabase
+        
+        Os registros são enviados em lotes de SUPABASE_BATCH_INSERT_SIZE
+        (uma requisição por lote). Se um lote falhar, tenta registro a registro;
+        a falha de um lote não impede os lotes seguintes nem os pedidos de
+        rastreamento. Falhas são apenas logadas (salvamento não é crítico).
+        """
+        if not email_records:
+            return
+        
+        batch_size = settings.SUPABASE_BATCH_INSERT_SIZE
+        
+        try:
+            saved = 0
+            for i in range(0, len(email_records), batch_size):
+                chunk = email_records[i:i + batch_size]
+                try:
+                    save_processed_email(chunk)
+                    saved += len(chunk)
+                except Exception as batch_error:
+                    if len(chunk) == 1:
+                        logger.error(f"Failed to save email {chunk[0]['email_id']} to database: {batch_error}")
+                        continue
+                    logger.warning(f"Bulk save of {len(chunk)} emails failed, retrying individually: {batch_error}")
+                    for record in chunk:
+                        try:
+                            save_processed_email(record)
+                            saved += 1
+                        except Exception as db_error:
+                            logger.error(f"Failed to save email {record['email_id']} to database: {db_error}")
+            logger.info(f"{saved} email(s) saved to processed_emails table")
+            
+            # Salva também os pedidos de rastreamento
+            if tracking_records:
+                for i in range(0, len(tracking_records), batch_size):
+                    chunk = tracking_records[i:i + batch_size]
+                    try:
+                        save_tracking_requests(chunk)
+                        logger.info(f"{len(chunk)} tracking request(s) saved")
+                    except Exception as tracking_error:
+                        logger.error(f"Failed to save tracking requests: {tracking_error}")
+                        
+        except Exception as db_error:
+            logger.error(f"Failed to save emails to database: {db_error}")
+            # Continue processing even if save fails (non-critical)
+    
     def _parse_classification(self, gemini_response: Dict[str, Any]) -> EmailClassification:
         """
         Parse da resposta do Gemini para classificação
         """
+        g = gemini_response.get
+        
         try:
             # Se a resposta já tem os campos corretos
             if "is_support" in gemini_response:
                 return EmailClassification(
-                    is_support=bool(gemini_response.get("is_support", False)),
-                    is_tracking=bool(gemini_response.get("is_tracking", False)),
-                    urgency=gemini_response.get("urgency", "medium"),
-                    confidence=float(gemini_response.get("confidence", 0.5)),
-                    email_type=gemini_response.get("email_type", "other"),
-                    extracted_order_id=gemini_response.get("extracted_order_id"),
-                    product_name=gemini_response.get("product_name")
+                    is_support=bool(g("is_support", False)),
+                    is_tracking=bool(g("is_tracking", False)),
+                    urgency=g("urgency", "medium"),
+                    confidence=float(g("confidence", 0.5)),
+                    email_type=g("email_type", "other"),
+                    extracted_order_id=g("extracted_order_id"),
+                    product_name=g("product_name")
                 )
             
             # Compatibilidade com formato antigo
-            decision = gemini_response.get("decision", "ignore")
+            decision = g("decision", "ignore")
             is_support = decision == "respond"
             
             # Tenta detectar se é tracking pela razão ou tipo
-            reason = gemini_response.get("reason", "").lower()
-            email_type = gemini_response.get("email_type", "").lower()
-            is_tracking = any(word in reason + email_type for word in 
-                            ["tracking", "rastreamento", "pedido", "entrega", "order", "status"])
+            reason = g("reason", "").lower()
+            email_type = g("email_type", "").lower()
+            haystack = reason + email_type
+            is_tracking = any(word in haystack for word in _LEGACY_TRACKING_WORDS)
             
             return EmailClassification(
                 is_support=is_support,
                 is_tracking=is_tracking,
-                urgency=gemini_response.get("urgency", "medium"),
-                confidence=float(gemini_response.get("confidence", 0.5)),
-                email_type=gemini_response.get("email_type", "other"),
+                urgency=g("urgency", "medium"),
+                confidence=float(g("confidence", 0.5)),
+                email_type=g("email_type", "other"),
                 extracted_order_id=None
             )
             
@@ -303,7 +511,7 @@ Responda APENAS em formato JSON válido:
             logger.debug(f"Raw response: {gemini_response}")
             
             # Retorna classificação padrão
-            return EmailClassification(
+            return EmailClassification.model_construct(
                 is_support=True,  # Por segurança, assume que precisa responder
                 is_tracking=False,
                 urgency="medium",
@@ -318,9 +526,21 @@ Responda APENAS em formato JSON válido:
     ) -> TrackingResult:
         """
         Busca dados de rastreamento no MySQL
+        
+        Buscas que encontraram pedidos ficam em cache por TRACKING_CACHE_TTL
+        segundos, para que reenvios do mesmo cliente em um lote não repitam a
+        consulta. "Não encontrado" e erros não são guardados: o pedido pode
+        aparecer a qualquer momento e o MySQL pode voltar na próxima tentativa.
         """
-        import time
-        start_time = time.time()
+        cache_key = (sender_email.lower(), order_id)
+        now = time.monotonic()
+        cached = self._tracking_cache.get(cache_key)
+        if cached and cached[0] > now:
+            self._tracking_cache.move_to_end(cache_key)
+            logger.info("Tracking cache hit, skipping MySQL query")
+            return cached[1]
+        
+        start_ns = time.perf_counter_ns()
         
         try:
             # Busca no MySQL
@@ -330,44 +550,35 @@ Responda APENAS em formato JSON válido:
                     email=sender_email,
                     order_id=order_id
                 )
-                
-                if tracking_data:
-                    orders = [TrackingInfo(
-                        order_id=tracking_data.order_id,
-                        tracking_code=tracking_data.tracking_code,
-                        purchase_date=tracking_data.last_update,
-                        status=tracking_data.status.value if tracking_data.status else None
-                    )]
-                else:
-                    orders = []
+                source = [tracking_data] if tracking_data else []
             else:
                 # Busca todos os pedidos recentes do cliente
-                all_trackings = await mysql_service.find_all_trackings_by_email(
+                source = await mysql_service.find_all_trackings_by_email(
                     email=sender_email,
                     limit=5
                 )
-                
-                orders = [
-                    TrackingInfo(
-                        order_id=t.order_id,
-                        tracking_code=t.tracking_code,
-                        purchase_date=t.last_update,
-                        status=t.status.value if t.status else None
-                    )
-                    for t in all_trackings
-                ]
             
-            query_time_ms = int((time.time() - start_time) * 1000)
+            orders = [_to_tracking_info(t) for t in source]
             
-            return TrackingResult(
+            query_time_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
+            
+            result = TrackingResult(
                 found=len(orders) > 0,
                 orders=orders,
                 query_time_ms=query_time_ms
             )
             
+            if result.found:
+                self._tracking_cache[cache_key] = (now + settings.TRACKING_CACHE_TTL, result)
+                self._tracking_cache.move_to_end(cache_key)
+                while len(self._tracking_cache) > self.TRACKING_CACHE_SIZE:
+                    self._tracking_cache.popitem(last=False)
+            
+            return result
+            
         except Exception as e:
             logger.error(f"Error searching tracking: {e}")
-            query_time_ms = int((time.time() - start_time) * 1000)
+            query_time_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
             
             return TrackingResult(
                 found=False,
@@ -376,6 +587,25 @@ Responda APENAS em formato JSON válido:
                 error=str(e)
             )
     
+    def _build_error_response(self, email_id: str, error: Exception) -> EmailProcessingResponse:
+        """
+        Monta a resposta de um e-mail cujo processamento falhou
+        """
+        return EmailProcessingResponse(
+            email_id=email_id,
+            classification=EmailClassification.model_construct(
+                is_support=False,
+                is_tracking=False,
+                urgency="low",
+                confidence=0.0,
+                email_type="other"
+            ),
+            tracking_data=None,
+            tokens=TokenUsage.model_construct(),
+            processing_time=0.0,
+            error=str(error)
+        )
+    
     async def process_batch(
         self,
         emails: List[EmailInput],
@@ -383,48 +613,36 @@ Responda APENAS em formato JSON válido:
     ) -> List[EmailProcessingResponse]:
         """
         Processa múltiplos e-mails em lote
+        
+        Até max_concurrent e-mails ficam em processamento ao mesmo tempo; assim
+        que um termina, o próximo começa (sem esperar o mais lento de um grupo).
+        Os registros de todo o lote são salvos no final, com inserts em lote.
         """
-        import asyncio
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async def _process_one(email: EmailInput):
+            async with semaphore:
+                try:
+                    return await self._process_email(email)
+                except Exception as e:
+                    # Falha de um e-mail vira resultado de erro, sem derrubar o lote
+                    return self._build_error_response(email.email_id, e), None, None
+        
+        batch_results = await asyncio.gather(*[_process_one(email) for email in emails])
         
         results = []
+        email_records: List[Dict[str, Any]] = []
+        tracking_records: List[Dict[str, Any]] = []
         
-        # Processa em lotes
-        for i in range(0, len(emails), max_concurrent):
-            batch = emails[i:i + max_concurrent]
-            
-            # Processa batch em paralelo
-            batch_tasks = [
-                self.process_email(email)
-                for email in batch
-            ]
-            
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-            
-            # Converte exceções em resultados de erro
-            for j, result in enumerate(batch_results):
-                if isinstance(result, Exception):
-                    results.append(
-                        EmailProcessingResponse(
-                            email_id=batch[j].email_id,
-                            classification=EmailClassification(
-                                is_support=False,
-                                is_tracking=False,
-                                urgency="low",
-                                confidence=0.0,
-                                email_type="other"
-                            ),
-                            tracking_data=None,
-                            tokens=TokenUsage(),
-                            processing_time=0.0,
-                            error=str(result)
-                        )
-                    )
-                else:
-                    results.append(result)
-            
-            # Delay entre batches
-            if i + max_concurrent < len(emails):
-                await asyncio.sleep(0.5)
+        for response, email_record, tracking_record in batch_results:
+            results.append(response)
+            if email_record:
+                email_records.append(email_record)
+            if tracking_record:
+                tracking_records.append(tracking_record)
+        
+        # Salva todos os registros do lote de uma vez, em segundo plano
+        self._schedule_save(email_records, tracking_records)
         
         return results
 
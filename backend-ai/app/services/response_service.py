@@ -5,10 +5,15 @@ Serviço de geração de respostas usando Google Gemini
 import time
 import os
 import json
-from typing import Dict, Any, Optional, List
+import re
+import asyncio
+import hashlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from loguru import logger
 
-from ..core.gemini import get_gemini_client
+from ..core.gemini import get_gemini_client, extract_response_text
 from ..core.config import settings
 from ..models.response_generation import (
     ResponseGenerationInput,
@@ -22,6 +27,199 @@ from ..db.supabase import get_supabase
 from .cost_service import cost_service
 from google import genai
 from google.genai import types
+from google.genai import errors as genai_errors
+
+
+# Parâmetros de geração das respostas (iguais para todas as chamadas)
+_GENERATION_CONFIG: Dict[str, Any] = {
+    "temperature": 0.3,  # Balanceado para respostas (um pouco de criatividade)
+    "top_p": 0.95,
+    "max_output_tokens": 65000,  # Máximo para respostas completas
+    "response_mime_type": "application/json"
+}
+
+_THINKING_CONFIG = types.ThinkingConfig(
+    thinking_budget=-1  # Dynamic thinking mode
+)
+
+_SAFETY_SETTINGS = [
+    types.SafetySetting(category=category, threshold="BLOCK_NONE")
+    for category in (
+        "HARM_CATEGORY_HARASSMENT",
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_DANGEROUS_CONTENT"
+    )
+]
+
+# Modelos do prompt do usuário, preenchidos com format_map. Sem indentação:
+# espaços no início das linhas só viram tokens de entrada a mais
+_EMAIL_CONTEXT_TEMPLATE = """
+CONTEXTO DO E-MAIL:
+De: {from}
+Para: {to}
+Assunto: {subject}
+
+Corpo do e-mail:
+{body}
+
+CLASSIFICAÇÃO:
+- É suporte: {is_support}
+- É rastreamento: {is_tracking}
+- Produto mencionado: {product_name}
+- Urgência: {urgency}
+- Tipo: {email_type}
+"""
+
+_ORDER_TEMPLATE = """
+
+PEDIDO {order_id}:
+- Código de rastreamento: {tracking_code}
+- Data da compra: {purchase_date}
+- Status: {status}
+"""
+
+# Trechos fixos do prompt do usuário para a seção de rastreamento
+_TRACKING_HEADER = "\n\nDADOS DE RASTREAMENTO DISPONÍVEIS:"
+
+_NO_ORDERS_FOUND_NOTE = """
+
+RASTREAMENTO:
+Não foram encontrados pedidos com rastreamento para este e-mail.
+Orientação: Solicitar ao cliente o número do pedido ou verificar o e-mail de cadastro.
+"""
+
+_NO_TRACKING_DATA_NOTE = """
+
+OBSERVAÇÃO: Cliente solicitou rastreamento mas não foram encontrados dados no sistema.
+Informe que estamos verificando e solicite informações adicionais (número do pedido, nota fiscal, etc).
+"""
+
+
+# Resposta local para e-mails sem relação com os produtos (não passa pelo Gemini)
+_NOT_PRODUCT_RELATED_BODY = (
+    "Obrigado pelo seu contato. Sua mensagem não está relacionada aos nossos produtos. "
+    "Para dúvidas sobre nossos produtos (Alphacur, Arialief, Blinzador, GoldenFrib, "
+    "Kymezol, Presgera), entre em contato conosco."
+)
+
+
+# Início do histórico citado em respostas ("Em ..., Fulano escreveu:" / "On ..., X wrote:")
+_QUOTED_REPLY_HEADER_RE = re.compile(r"^\s*(?:Em .+ escreveu:|On .+ wrote:)\s*$", re.MULTILINE)
+
+_TRUNCATED_MARKER = "\n[... conteúdo truncado ...]"
+
+
+def _trim_email_body(body: str, max_chars: int) -> str:
+    """
+    Remove o histórico citado e limita o tamanho do corpo do e-mail
+    
+    Corta a partir do cabeçalho de resposta citada e descarta linhas iniciadas
+    por ">" (mantendo o texto original se nada sobrar). Se ainda passar de
+    max_chars, corta no último espaço antes do limite e sinaliza o corte.
+    """
+    if not body:
+        return body
+    
+    trimmed = body
+    header = _QUOTED_REPLY_HEADER_RE.search(trimmed)
+    if header:
+        trimmed = trimmed[:header.start()]
+    if ">" in trimmed:
+        trimmed = "\n".join(
+            line for line in trimmed.split("\n") if not line.lstrip().startswith(">")
+        )
+    trimmed = trimmed.strip() or body
+    
+    if len(trimmed) <= max_chars:
+        return trimmed
+    
+    cut = trimmed.rfind(" ", 0, max_chars)
+    return trimmed[:cut if cut > 0 else max_chars] + _TRUNCATED_MARKER
+
+
+def _has_expected_types(fields: Dict[str, Any]) -> bool:
+    """
+    Verifica se os campos vindos do Gemini já têm os tipos de GeneratedResponse
+    """
+    return (
+        isinstance(fields['suggested_subject'], str)
+        and isinstance(fields['suggested_body'], str)
+        and isinstance(fields['addresses_support'], bool)
+        and isinstance(fields['addresses_tracking'], bool)
+        and isinstance(fields['requires_followup'], bool)
+        and (fields['tracking_included'] is None or isinstance(fields['tracking_included'], dict))
+        and (fields['internal_notes'] is None or isinstance(fields['internal_notes'], str))
+        and isinstance(fields['priority_actions'], list)
+        and all(isinstance(action, str) for action in fields['priority_actions'])
+    )
+
+
+def _is_context_cache_miss(error: Exception) -> bool:
+    """
+    Indica se o erro do Gemini é de cache de contexto inexistente ou expirado
+    
+    Só esses casos justificam repetir a chamada com o prompt inline; limite de
+    taxa (429), erros 5xx e timeouts sobem normalmente, sem descartar o cache.
+    """
+    if not isinstance(error, genai_errors.ClientError):
+        return False
+    if error.code == 404 or error.status == "NOT_FOUND":
+        return True
+    if error.code == 400 or error.status == "INVALID_ARGUMENT":
+        message = (error.message or str(error)).lower()
+        return "cachedcontent" in message or "cached content" in message or "cached_content" in message
+    return False
+
+
+# Métricas por resposta gerada: (email_id, tempo_ms, tokens_prompt, tokens_saida, tipo).
+# Acumuladas aqui e resumidas periodicamente em uma única linha de log
+_METRICS: "deque[Tuple[str, int, int, int, str]]" = deque(maxlen=10_000)
+
+
+def _flush_metrics() -> None:
+    """
+    Esvazia o buffer de métricas e registra um resumo em uma linha
+    """
+    count = len(_METRICS)
+    if not count:
+        return
+    total_ms = max_ms = prompt_tokens = output_tokens = 0
+    by_type: Dict[str, int] = {}
+    for _ in range(count):
+        _, elapsed_ms, prompt, output, response_type = _METRICS.popleft()
+        total_ms += elapsed_ms
+        if elapsed_ms > max_ms:
+            max_ms = elapsed_ms
+        prompt_tokens += prompt
+        output_tokens += output
+        by_type[response_type] = by_type.get(response_type, 0) + 1
+    logger.info(
+        f"Responses generated: {count} - "
+        f"Avg time: {total_ms // count}ms, Max time: {max_ms}ms, "
+        f"Tokens: {prompt_tokens} prompt / {output_tokens} output, "
+        f"Types: {by_type}"
+    )
+
+
+# Diretórios de prompts e de informações de produtos (raiz do backend)
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+_PROMPTS_DIR = os.path.join(_BASE_DIR, 'prompts')
+_DOCS_DIR = os.path.join(_BASE_DIR, 'docs')
+
+# Parte fixa do prompt do usuário, byte a byte idêntica entre chamadas.
+# Fica no início para que requisições do mesmo tipo compartilhem o prefixo.
+_USER_PROMPT_PREAMBLES: Dict[str, str] = {
+    'support': (
+        "Gere uma resposta apropriada seguindo as diretrizes do prompt.\n"
+        "A seguir estão o e-mail do cliente e a classificação dele.\n"
+    ),
+    'combined': (
+        "Gere uma resposta apropriada seguindo as diretrizes do prompt.\n"
+        "A seguir estão o e-mail do cliente, a classificação dele e os dados "
+        "de rastreamento encontrados.\n"
+    ),
+}
 
 
 class ResponseService:
@@ -29,9 +227,36 @@ class ResponseService:
     Serviço para gerar respostas de e-mail usando Gemini AI
     """
     
+    # Antecedência (s) com que um cache de contexto é recriado antes de expirar
+    CONTEXT_CACHE_REFRESH_MARGIN = 300
+    # Máximo de respostas mantidas no cache em memória
+    RESPONSE_CACHE_SIZE = 1024
+    # Threads do pool de I/O bloqueante (cliente Supabase síncrono)
+    IO_POOL_WORKERS = 8
+    
     def __init__(self):
-        self.support_prompt: Optional[str] = None
-        self.combined_prompt: Optional[str] = None
+        # Prompts carregados uma única vez, na criação do serviço
+        self._prompts: Dict[str, str] = {
+            prompt_type: self._load_prompt(prompt_type)
+            for prompt_type in ('support', 'combined')
+        }
+        # Caches de contexto do Gemini: (tipo, produto) -> (expira_em, nome do cache ou None)
+        self._context_caches: Dict[Tuple[str, Optional[str]], Tuple[float, Optional[str]]] = {}
+        self._context_cache_lock = asyncio.Lock()
+        # Informações de produto já lidas do disco: produto -> conteúdo
+        self._product_info: Dict[str, str] = {}
+        # Cache LRU com TTL: chave do conteúdo -> (expira_em, resposta gerada)
+        self._response_cache: "OrderedDict[str, Tuple[float, GeneratedResponse]]" = OrderedDict()
+        # Configurações de geração: (tipo, produto, usa cache) -> config
+        self._generate_configs: Dict[Tuple[str, Optional[str], bool], types.GenerateContentConfig] = {}
+        # Gerações em andamento: chave do conteúdo -> future com a resposta
+        self._inflight: Dict[str, "asyncio.Future[Optional[GeneratedResponse]]"] = {}
+        # Salvamentos em segundo plano ainda não concluídos (aguardados no shutdown)
+        self._pending_saves: "set[asyncio.Task]" = set()
+        # Tarefa de resumo periódico das métricas (iniciada no startup)
+        self._metrics_task: Optional[asyncio.Task] = None
+        # Pool de I/O do serviço, criado no primeiro uso e encerrado em close()
+        self._io_pool: Optional[ThreadPoolExecutor] = None
     
     def _load_prompt(self, prompt_type: str) -> str:
         """
@@ -41,27 +266,11 @@ class ResponseService:
             prompt_type: 'support' ou 'combined'
         """
         try:
-            if prompt_type == 'support' and self.support_prompt:
-                return self.support_prompt
-            elif prompt_type == 'combined' and self.combined_prompt:
-                return self.combined_prompt
-            
-            filename = f"{prompt_type}_response_prompt.txt"
-            prompt_path = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-                'prompts',
-                filename
-            )
+            prompt_path = os.path.join(_PROMPTS_DIR, f"{prompt_type}_response_prompt.txt")
             
             with open(prompt_path, 'r', encoding='utf-8') as f:
                 content = f.read().strip()
             
-            # Cache o prompt
-            if prompt_type == 'support':
-                self.support_prompt = content
-            else:
-                self.combined_prompt = content
-            
             logger.info(f"{prompt_type} prompt loaded successfully")
             return content
             
@@ -82,17 +291,19 @@ class ResponseService:
         if not product_name:
             return None
         
+        # Arquivos de produto são estáticos: lidos do disco uma vez por processo
+        cached = self._product_info.get(product_name)
+        if cached is not None:
+            return cached
+        
         try:
-            product_path = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-                'docs',
-                f'{product_name}.txt'
-            )
+            product_path = os.path.join(_DOCS_DIR, f'{product_name}.txt')
             
             if os.path.exists(product_path):
                 with open(product_path, 'r', encoding='utf-8') as f:
                     content = f.read().strip()
                 logger.info(f"Product information loaded for {product_name}")
+                self._product_info[product_name] = content
                 return content
             else:
                 logger.warning(f"Product file not found: {product_name}.txt")
@@ -102,10 +313,112 @@ class ResponseService:
             logger.error(f"Failed to load product info for {product_name}: {e}")
             return None
     
+    async def _get_context_cache(
+        self,
+        key: Tuple[str, Optional[str]],
+        system_prompt: str
+    ) -> Optional[str]:
+        """
+        Retorna o nome do cache de contexto do Gemini para o system prompt
+        
+        O system prompt (prompt do tipo de resposta + informações do produto) é
+        idêntico para todas as respostas de um mesmo (tipo, produto), então é
+        enviado uma vez ao Gemini e referenciado por cached_content. O cache é
+        recriado quando está perto de expirar. Se a criação falhar (ex.: prompt
+        abaixo do mínimo de tokens do modelo), retorna None até o próximo TTL e
+        o prompt segue inline.
+        """
+        if not settings.GEMINI_CONTEXT_CACHE_ENABLED:
+            return None
+        
+        now = time.monotonic()
+        entry = self._context_caches.get(key)
+        if entry and entry[0] - self.CONTEXT_CACHE_REFRESH_MARGIN > now:
+            return entry[1]
+        
+        async with self._context_cache_lock:
+            # Outra corrotina pode ter criado o cache enquanto esperávamos
+            entry = self._context_caches.get(key)
+            if entry and entry[0] - self.CONTEXT_CACHE_REFRESH_MARGIN > now:
+                return entry[1]
+            
+            ttl = settings.GEMINI_CONTEXT_CACHE_TTL
+            try:
+                cache = await get_gemini_client().aio.caches.create(
+                    model=settings.GEMINI_MODEL,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=system_prompt,
+                        ttl=f"{ttl}s"
+                    )
+                )
+                name = cache.name
+                logger.info(f"Gemini context cache created for {key[0]}/{key[1]}: {name}")
+            except Exception as e:
+                name = None
+                logger.warning(f"Could not create Gemini context cache for {key[0]}/{key[1]}, using inline prompt: {e}")
+            
+            self._context_caches[key] = (now + ttl, name)
+            return name
+    
+    def _get_generate_config(
+        self,
+        cache_key: Tuple[str, Optional[str]],
+        system_prompt: str,
+        cached_content: Optional[str] = None
+    ) -> types.GenerateContentConfig:
+        """
+        Retorna a configuração de geração, com system prompt inline ou em cache
+        
+        A configuração é montada uma vez por (tipo, produto, modo) e reutilizada;
+        só é refeita quando o cache de contexto referenciado muda.
+        """
+        key = cache_key + (cached_content is not None,)
+        config = self._generate_configs.get(key)
+        if config is not None and config.cached_content == cached_content:
+            return config
+        
+        if cached_content:
+            # Com cache, o system instruction já está no conteúdo em cache
+            prompt_config = {"cached_content": cached_content}
+        else:
+            prompt_config = {"system_instruction": system_prompt}  # System instruction correta
+        
+        config = types.GenerateContentConfig(
+            **prompt_config,
+            thinking_config=_THINKING_CONFIG,
+            **_GENERATION_CONFIG,
+            safety_settings=_SAFETY_SETTINGS
+        )
+        self._generate_configs[key] = config
+        return config
+    
+    def _get_cached_response(self, key: str) -> Optional[GeneratedResponse]:
+        """
+        Retorna a resposta em cache para a chave, se ainda válida
+        """
+        cached = self._response_cache.get(key)
+        if cached is None:
+            return None
+        if cached[0] <= time.monotonic():
+            del self._response_cache[key]
+            return None
+        self._response_cache.move_to_end(key)
+        return cached[1]
+    
+    def _store_cached_response(self, key: str, response: GeneratedResponse):
+        """
+        Guarda uma resposta gerada por CACHE_TTL segundos
+        """
+        self._response_cache[key] = (time.monotonic() + settings.CACHE_TTL, response)
+        self._response_cache.move_to_end(key)
+        while len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+    
     async def generate_response(
         self,
         request: ResponseGenerationInput,
-        save_to_db: bool = True
+        save_to_db: bool = True,
+        wait_for_save: bool = True
     ) -> GeneratedResponse:
         """
         Gera resposta para e-mail usando Gemini AI
@@ -113,114 +426,134 @@ class ResponseService:
         Args:
             request: Dados para geração da resposta
             save_to_db: Se deve salvar no banco
+            wait_for_save: Se deve aguardar o salvamento antes de retornar. Com
+                False o salvamento roda em segundo plano e saved_to_db fica False
             
         Returns:
             Resposta gerada
         """
+        generated, costs = await self._generate_response(request)
+        
+        # Salva no banco se solicitado
+        if save_to_db and not generated.error:
+            if wait_for_save:
+                await self._save_to_database(generated, request, costs)
+                generated.saved_to_db = True
+            else:
+                self._schedule_save(generated, request, costs)
+        
+        return generated
+    
+    def _schedule_save(
+        self,
+        response: GeneratedResponse,
+        request: ResponseGenerationInput,
+        costs: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Agenda o salvamento da resposta sem bloquear o retorno ao chamador
+        """
+        task = asyncio.create_task(self._save_in_background(response, request, costs))
+        self._pending_saves.add(task)
+        task.add_done_callback(self._pending_saves.discard)
+    
+    async def _save_in_background(
+        self,
+        response: GeneratedResponse,
+        request: ResponseGenerationInput,
+        costs: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Salva a resposta engolindo o erro (já logado em _save_to_database)
+        """
+        try:
+            await self._save_to_database(response, request, costs)
+        except Exception:
+            pass
+    
+    async def _generate_response(
+        self,
+        request: ResponseGenerationInput
+    ) -> Tuple[GeneratedResponse, Optional[Dict[str, Any]]]:
+        """
+        Gera a resposta com Gemini, sem salvar no banco
+        
+        Returns:
+            Tupla (resposta gerada, custos do processamento ou None)
+        """
         start_time = time.time()
+        # Geração registrada como em andamento para esta chave (se houver)
+        inflight: Optional["asyncio.Future[Optional[GeneratedResponse]]"] = None
+        response_key = None
         
         try:
             # Determina tipo de resposta
             is_support = request.classification.get('is_support', False)
             is_tracking = request.classification.get('is_tracking', False)
-            has_tracking_data = request.tracking_data and request.tracking_data.get('found', False)
-            product_name = request.classification.get('product_name')
             
-            # Verifica se o email é sobre um produto válido
-            if not product_name:
-                logger.warning(f"Email {request.email_id} não está relacionado a nenhum produto conhecido")
-                # Se não for sobre produto, retorna resposta genérica ou erro
-                if not is_support and not is_tracking:
-                    return GeneratedResponse(
-                        email_id=request.email_id,
-                        suggested_subject="Re: Sua mensagem",
-                        response_body="Obrigado pelo seu contato. Sua mensagem não está relacionada aos nossos produtos. Para dúvidas sobre nossos produtos (Alphacur, Arialief, Blinzador, GoldenFrib, Kymezol, Presgera), entre em contato conosco.",
-                        tone=ResponseTone.NEUTRAL,
-                        response_type="not_product_related",
-                        confidence=0.5,
-                        processing_time_ms=int((time.time() - start_time) * 1000),
-                        saved_to_db=False,
-                        error="Email não relacionado a produtos"
-                    )
+            # Casos triviais respondidos com modelo local, sem chamar o Gemini
+            templated = self._template_response(request, start_time)
+            if templated is not None:
+                return templated, None
             
-            # Carrega informações do produto
-            product_info = self._load_product_info(product_name) if product_name else None
+            response_type, cache_key, system_prompt, user_prompt = self._prepare_prompts(request)
             
-            if is_support and is_tracking and has_tracking_data:
-                response_type = 'combined'
-                system_prompt = self._load_prompt('combined')
-            else:
-                response_type = 'support'
-                system_prompt = self._load_prompt('support')
-            
-            # Adiciona informações do produto ao prompt do sistema
-            if product_info:
-                system_prompt += f"\n\n=== INFORMAÇÕES DO PRODUTO {product_name.upper()} ===\n{product_info}\n=== FIM DAS INFORMAÇÕES DO PRODUTO ===\n\nUse as informações acima sobre o produto {product_name} para fornecer respostas precisas e específicas ao cliente."
-            
-            # Prepara contexto para LLM
-            user_prompt = self._build_user_prompt(request, response_type)
+            # Reaproveita resposta recente para o mesmo conteúdo (retry, webhook reenviado)
+            cacheable = (
+                settings.ENABLE_RESPONSE_CACHE
+                and not request.priority_message
+                and not request.custom_tone
+            )
+            if cacheable:
+                response_key = hashlib.blake2b(
+                    "\x00".join((response_type, system_prompt, user_prompt)).encode("utf-8"),
+                    digest_size=16
+                ).hexdigest()
+                cached = self._get_cached_response(response_key)
+                if cached is not None:
+                    logger.info(f"Response cache hit for email {request.email_id}, skipping Gemini call")
+                    return self._reuse_response(cached, request, start_time), None
+                
+                # Mesmo conteúdo já sendo gerado (ex.: e-mails idênticos no mesmo
+                # lote): aguarda essa geração em vez de repetir a chamada
+                pending = self._inflight.get(response_key)
+                if pending is not None:
+                    shared = await asyncio.shield(pending)
+                    if shared is not None:
+                        logger.info(f"Identical generation in flight for email {request.email_id}, reusing it")
+                        return self._reuse_response(shared, request, start_time), None
+                else:
+                    inflight = asyncio.get_running_loop().create_future()
+                    self._inflight[response_key] = inflight
             
             # Chama Gemini
             client = get_gemini_client()
+            contents = [
+                {"role": "user", "parts": [{"text": user_prompt}]}
+            ]
             
-            generation_config = {
-                "temperature": 0.3,  # Balanceado para respostas (um pouco de criatividade)
-                "top_p": 0.95,
-                "max_output_tokens": 65000,  # Máximo para respostas completas
-                "response_mime_type": "application/json"
-            }
+            cached_content = await self._get_context_cache(cache_key, system_prompt)
             
-            response = client.models.generate_content(
-                model=settings.GEMINI_MODEL,
-                contents=[
-                    {"role": "user", "parts": [{"text": user_prompt}]}
-                ],
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,  # System instruction correta
-                    thinking_config=types.ThinkingConfig(
-                        thinking_budget=-1  # Dynamic thinking mode
-                    ),
-                    **generation_config,
-                    safety_settings=[
-                        {
-                            "category": "HARM_CATEGORY_HARASSMENT",
-                            "threshold": "BLOCK_NONE"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_HATE_SPEECH",
-                            "threshold": "BLOCK_NONE"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                            "threshold": "BLOCK_NONE"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                            "threshold": "BLOCK_NONE"
-                        }
-                    ]
+            try:
+                response = await client.aio.models.generate_content(
+                    model=settings.GEMINI_MODEL,
+                    contents=contents,
+                    config=self._get_generate_config(cache_key, system_prompt, cached_content)
+                )
+            except genai_errors.ClientError as e:
+                if not cached_content or not _is_context_cache_miss(e):
+                    raise
+                # Cache expirado/removido no servidor: descarta e repete com prompt inline
+                logger.warning(f"Gemini call with context cache {cached_content} failed, retrying inline: {e}")
+                self._context_caches.pop(cache_key, None)
+                response = await client.aio.models.generate_content(
+                    model=settings.GEMINI_MODEL,
+                    contents=contents,
+                    config=self._get_generate_config(cache_key, system_prompt)
                 )
-            )
             
             # Parse resposta com tratamento seguro
-            result_text = None
-            
-            # Primeiro tenta response.text
-            if hasattr(response, 'text') and response.text:
-                result_text = response.text
-            # Depois tenta via candidates
-            elif hasattr(response, 'candidates') and response.candidates:
-                for candidate in response.candidates:
-                    if hasattr(candidate, 'content') and candidate.content:
-                        if hasattr(candidate.content, 'parts') and candidate.content.parts:
-                            for part in candidate.content.parts:
-                                if hasattr(part, 'text') and part.text:
-                                    result_text = part.text
-                                    break
-                        elif hasattr(candidate.content, 'text') and candidate.content.text:
-                            result_text = candidate.content.text
-                    if result_text:
-                        break
+            result_text = extract_response_text(response)
             
             if not result_text:
                 # Verifica se foi truncado por MAX_TOKENS
@@ -242,19 +575,20 @@ class ResponseService:
             # Calcula custos se temos dados de tokens
             costs = None
             if token_metadata.get('total_tokens', 0) > 0:
-                token_usage = TokenUsage(
+                token_usage = TokenUsage.model_construct(
                     input_tokens=token_metadata.get('prompt_tokens', 0),
                     output_tokens=token_metadata.get('output_tokens', 0),
                     thought_tokens=token_metadata.get('thought_tokens', 0),
+                    cached_tokens=token_metadata.get('cached_tokens', 0),
                     total_tokens=token_metadata.get('total_tokens', 0)
                 )
-                costs = await cost_service.calculate_costs(
+                costs = cost_service.calculate_costs_cached(
                     token_usage=token_usage,
                     model_name="gemini-2.5-flash"
                 )
             
             # Cria resposta
-            generated = GeneratedResponse(
+            fields = dict(
                 email_id=request.email_id,
                 suggested_subject=response_data['subject'],
                 suggested_body=response_data['body'],
@@ -273,24 +607,237 @@ class ResponseService:
                 total_tokens=token_metadata.get('total_tokens'),
                 saved_to_db=False
             )
+            # JSON no formato pedido ao Gemini dispensa a validação do pydantic;
+            # qualquer campo com tipo inesperado passa pela validação completa
+            if _has_expected_types(fields):
+                generated = GeneratedResponse.model_construct(**fields)
+            else:
+                generated = GeneratedResponse(**fields)
             
-            # Salva no banco se solicitado
-            if save_to_db:
-                await self._save_to_database(generated, request, costs)
-                generated.saved_to_db = True
+            if cacheable:
+                self._store_cached_response(response_key, generated)
+            if inflight is not None:
+                inflight.set_result(generated)
             
-            logger.info(
-                f"Response generated for email {request.email_id} - "
-                f"Type: {response_type}, "
-                f"Time: {processing_time_ms}ms"
-            )
+            _METRICS.append((
+                request.email_id,
+                processing_time_ms,
+                token_metadata.get('prompt_tokens') or 0,
+                token_metadata.get('output_tokens') or 0,
+                response_type
+            ))
+            if settings.DEBUG:
+                logger.info(
+                    f"Response generated for email {request.email_id} - "
+                    f"Type: {response_type}, "
+                    f"Time: {processing_time_ms}ms"
+                )
             
-            return generated
+            return generated, costs
             
         except Exception as e:
             logger.error(f"Error generating response for email {request.email_id}: {e}")
             # Re-raise the exception to let the API endpoint handle it with proper HTTP status
             raise
+        
+        finally:
+            if inflight is not None:
+                self._inflight.pop(response_key, None)
+                # Em caso de erro, quem aguardava faz a própria chamada
+                if not inflight.done():
+                    inflight.set_result(None)
+    
+    def _reuse_response(
+        self,
+        response: GeneratedResponse,
+        request: ResponseGenerationInput,
+        start_time: float
+    ) -> GeneratedResponse:
+        """
+        Copia uma resposta já gerada para outro e-mail de mesmo conteúdo
+        
+        Nada foi consumido nesta chamada: sem tokens e sem custos.
+        """
+        return response.model_copy(update={
+            "email_id": request.email_id,
+            "processing_time_ms": int((time.time() - start_time) * 1000),
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "saved_to_db": False
+        })
+    
+    def _template_response(
+        self,
+        request: ResponseGenerationInput,
+        start_time: float
+    ) -> Optional[GeneratedResponse]:
+        """
+        Retorna resposta pronta (sem LLM) para e-mails que não precisam do Gemini
+        
+        Hoje cobre e-mails sem produto conhecido que não são de suporte nem de
+        rastreamento. Retorna None quando o e-mail deve seguir para o Gemini.
+        """
+        classification = request.classification
+        if classification.get('product_name'):
+            return None
+        
+        logger.warning(f"Email {request.email_id} não está relacionado a nenhum produto conhecido")
+        if classification.get('is_support', False) or classification.get('is_tracking', False):
+            return None
+        
+        return GeneratedResponse.model_construct(
+            email_id=request.email_id,
+            suggested_subject="Re: Sua mensagem",
+            suggested_body=_NOT_PRODUCT_RELATED_BODY,
+            tone=ResponseTone.PROFESSIONAL,
+            addresses_support=False,
+            addresses_tracking=False,
+            tracking_included=None,
+            priority_actions=[],
+            requires_followup=False,
+            internal_notes=None,
+            response_type="not_product_related",
+            confidence=0.5,
+            processing_time_ms=int((time.time() - start_time) * 1000),
+            prompt_tokens=None,
+            output_tokens=None,
+            total_tokens=None,
+            saved_to_db=False,
+            error="Email não relacionado a produtos"
+        )
+    
+    def _prepare_prompts(
+        self,
+        request: ResponseGenerationInput
+    ) -> Tuple[str, Tuple[str, Optional[str]], str, str]:
+        """
+        Escolhe o tipo de resposta e monta os prompts de sistema e do usuário
+        
+        Returns:
+            Tupla (tipo de resposta, chave do cache de contexto,
+            system prompt, prompt do usuário)
+        """
+        is_support = request.classification.get('is_support', False)
+        is_tracking = request.classification.get('is_tracking', False)
+        has_tracking_data = request.tracking_data and request.tracking_data.get('found', False)
+        product_name = request.classification.get('product_name')
+        
+        # Carrega informações do produto
+        product_info = self._load_product_info(product_name) if product_name else None
+        
+        if is_support and is_tracking and has_tracking_data:
+            response_type = 'combined'
+            system_prompt = self._prompts['combined']
+        else:
+            response_type = 'support'
+            system_prompt = self._prompts['support']
+        
+        # Adiciona informações do produto ao prompt do sistema
+        if product_info:
+            system_prompt += f"\n\n=== INFORMAÇÕES DO PRODUTO {product_name.upper()} ===\n{product_info}\n=== FIM DAS INFORMAÇÕES DO PRODUTO ===\n\nUse as informações acima sobre o produto {product_name} para fornecer respostas precisas e específicas ao cliente."
+        
+        # Prepara contexto para LLM
+        user_prompt = self._build_user_prompt(request, response_type)
+        
+        cache_key = (response_type, product_name if product_info else None)
+        return response_type, cache_key, system_prompt, user_prompt
+    
+    async def generate_response_stream(
+        self,
+        request: ResponseGenerationInput
+    ) -> AsyncIterator[str]:
+        """
+        Gera resposta em streaming, devolvendo o texto à medida que chega
+        
+        Os pedaços formam, juntos, o mesmo JSON de generate_response. Não usa o
+        cache de respostas nem salva no banco: serve para a interface mostrar a
+        resposta antes de o Gemini terminar.
+        
+        Raises:
+            ValueError: Se o e-mail não for sobre produto, suporte ou rastreamento
+        """
+        classification = request.classification
+        if (not classification.get('product_name')
+                and not classification.get('is_support', False)
+                and not classification.get('is_tracking', False)):
+            raise ValueError("Email não relacionado a produtos")
+        
+        _, cache_key, system_prompt, user_prompt = self._prepare_prompts(request)
+        cached_content = await self._get_context_cache(cache_key, system_prompt)
+        
+        stream = await get_gemini_client().aio.models.generate_content_stream(
+            model=settings.GEMINI_MODEL,
+            contents=[
+                {"role": "user", "parts": [{"text": user_prompt}]}
+            ],
+            config=self._get_generate_config(cache_key, system_prompt, cached_content)
+        )
+        
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+    
+    async def _run_io(self, fn, *args):
+        """
+        Executa uma chamada bloqueante no pool de I/O do serviço
+        
+        O pool é dedicado para não disputar o executor padrão do event loop com
+        o restante da aplicação. É recriado se já tiver sido encerrado por
+        close(), então o serviço continua utilizável após um novo startup.
+        """
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(
+                max_workers=self.IO_POOL_WORKERS,
+                thread_name_prefix="response-io"
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._io_pool, fn, *args)
+    
+    def start_metrics_flush(self) -> None:
+        """
+        Inicia a tarefa que resume as métricas de geração periodicamente (startup)
+        """
+        if self._metrics_task is None:
+            self._metrics_task = asyncio.create_task(self._metrics_flush_loop())
+    
+    async def _metrics_flush_loop(self) -> None:
+        """
+        Resume as métricas a cada METRICS_FLUSH_INTERVAL segundos, ou antes
+        disso se o buffer acumular METRICS_FLUSH_SIZE registros
+        """
+        interval = settings.METRICS_FLUSH_INTERVAL
+        while True:
+            waited = 0.0
+            while waited < interval and len(_METRICS) < settings.METRICS_FLUSH_SIZE:
+                await asyncio.sleep(1)
+                waited += 1
+            _flush_metrics()
+    
+    async def close(self):
+        """
+        Para o resumo de métricas e encerra o pool de I/O, aguardando os
+        salvamentos em andamento (shutdown)
+        """
+        if self._pending_saves:
+            logger.info(f"Waiting for {len(self._pending_saves)} pending response save(s)...")
+            await asyncio.gather(*self._pending_saves, return_exceptions=True)
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+            try:
+                await self._metrics_task
+            except asyncio.CancelledError:
+                pass
+            self._metrics_task = None
+        _flush_metrics()
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=True)
+            self._io_pool = None
+    
+    def _static_preamble(self, response_type: str) -> str:
+        """
+        Retorna a parte fixa do prompt do usuário para o tipo de resposta
+        """
+        return _USER_PROMPT_PREAMBLES.get(response_type, _USER_PROMPT_PREAMBLES['support'])
     
     def _build_user_prompt(
         self,
@@ -303,22 +850,22 @@ class ResponseService:
         email = request.email_content
         classification = request.classification
         
-        prompt = f"""
-        CONTEXTO DO E-MAIL:
-        De: {email.get('from', 'Desconhecido')}
-        Para: {email.get('to', 'Desconhecido')}
-        Assunto: {email.get('subject', 'Sem assunto')}
+        # Parte fixa primeiro (prefixo idêntico entre chamadas favorece o cache
+        # implícito do Gemini); os dados variáveis do e-mail vêm depois.
+        # As partes são juntadas uma única vez no final.
+        parts: List[str] = [self._static_preamble(response_type)]
         
-        Corpo do e-mail:
-        {email.get('body', '')}
-        
-        CLASSIFICAÇÃO:
-        - É suporte: {classification.get('is_support', False)}
-        - É rastreamento: {classification.get('is_tracking', False)}
-        - Produto mencionado: {classification.get('product_name', 'Nenhum')}
-        - Urgência: {classification.get('urgency', 'normal')}
-        - Tipo: {classification.get('email_type', 'other')}
-        """
+        parts.append(_EMAIL_CONTEXT_TEMPLATE.format_map({
+            'from': email.get('from', 'Desconhecido'),
+            'to': email.get('to', 'Desconhecido'),
+            'subject': email.get('subject', 'Sem assunto'),
+            'body': _trim_email_body(email.get('body', ''), settings.MAX_BODY_CHARS),
+            'is_support': classification.get('is_support', False),
+            'is_tracking': classification.get('is_tracking', False),
+            'product_name': classification.get('product_name', 'Nenhum'),
+            'urgency': classification.get('urgency', 'normal'),
+            'email_type': classification.get('email_type', 'other')
+        }))
         
         # Adiciona dados de rastreamento se disponível
         if request.tracking_data and response_type == 'combined':
@@ -326,42 +873,32 @@ class ResponseService:
             
             # Verifica se tem dados de rastreamento
             if tracking_data.get('found') and tracking_data.get('orders'):
-                prompt += "\n\n        DADOS DE RASTREAMENTO DISPONÍVEIS:"
+                parts.append(_TRACKING_HEADER)
                 
                 # Processa cada pedido encontrado
-                for order in tracking_data['orders'][:3]:  # Limita a 3 pedidos
-                    prompt += f"""
-        
-        PEDIDO {order.get('order_id', 'N/A')}:
-        - Código de rastreamento: {order.get('tracking_code', 'Não disponível')}
-        - Data da compra: {order.get('purchase_date', 'Não disponível')}
-        - Status: {order.get('status', 'Em processamento')}
-        """
+                parts.extend(
+                    _ORDER_TEMPLATE.format_map({
+                        'order_id': order.get('order_id', 'N/A'),
+                        'tracking_code': order.get('tracking_code', 'Não disponível'),
+                        'purchase_date': order.get('purchase_date', 'Não disponível'),
+                        'status': order.get('status', 'Em processamento')
+                    })
+                    for order in tracking_data['orders'][:3]  # Limita a 3 pedidos
+                )
             else:
-                prompt += """
-        
-        RASTREAMENTO:
-        Não foram encontrados pedidos com rastreamento para este e-mail.
-        Orientação: Solicitar ao cliente o número do pedido ou verificar o e-mail de cadastro.
-        """
+                parts.append(_NO_ORDERS_FOUND_NOTE)
         
         elif response_type == 'combined' and not request.tracking_data:
-            prompt += """
-        
-        OBSERVAÇÃO: Cliente solicitou rastreamento mas não foram encontrados dados no sistema.
-        Informe que estamos verificando e solicite informações adicionais (número do pedido, nota fiscal, etc).
-        """
+            parts.append(_NO_TRACKING_DATA_NOTE)
         
         # Adiciona instruções especiais se houver
         if request.priority_message:
-            prompt += f"\n\nMENSAGEM PRIORITÁRIA PARA INCLUIR: {request.priority_message}"
+            parts.append(f"\n\nMENSAGEM PRIORITÁRIA PARA INCLUIR: {request.priority_message}")
         
         if request.custom_tone:
-            prompt += f"\n\nTOM SOLICITADO: {request.custom_tone.value}"
-        
-        prompt += "\n\nGere uma resposta apropriada seguindo as diretrizes do prompt."
+            parts.append(f"\n\nTOM SOLICITADO: {request.custom_tone.value}")
         
-        return prompt
+        return "".join(parts)
     
     def _extract_token_metadata(self, response) -> Dict[str, int]:
         """
@@ -371,33 +908,65 @@ class ResponseService:
             "prompt_tokens": 0,
             "output_tokens": 0,
             "thought_tokens": 0,
+            "cached_tokens": 0,
             "total_tokens": 0
         }
         
-        if hasattr(response, 'usage_metadata'):
-            usage = response.usage_metadata
-            
-            if hasattr(usage, 'prompt_token_count'):
-                metadata["prompt_tokens"] = usage.prompt_token_count
-            
-            if hasattr(usage, 'candidates_token_count'):
-                metadata["output_tokens"] = usage.candidates_token_count
-            
-            # Captura thinking tokens se disponível
-            if hasattr(usage, 'thought_token_count'):
-                metadata["thought_tokens"] = usage.thought_token_count
-            
-            if hasattr(usage, 'total_token_count'):
-                metadata["total_tokens"] = usage.total_token_count
-            else:
-                metadata["total_tokens"] = (
-                    metadata["prompt_tokens"] + 
-                    metadata["output_tokens"] + 
-                    metadata["thought_tokens"]
-                )
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return metadata
+        
+        metadata["prompt_tokens"] = getattr(usage, 'prompt_token_count', 0) or 0
+        metadata["output_tokens"] = getattr(usage, 'candidates_token_count', 0) or 0
+        # Captura thinking tokens se disponível
+        metadata["thought_tokens"] = getattr(usage, 'thoughts_token_count', 0) or 0
+        # Parte dos tokens de entrada servida pelo cache de contexto (cobrada à parte)
+        metadata["cached_tokens"] = getattr(usage, 'cached_content_token_count', 0) or 0
+        metadata["total_tokens"] = getattr(usage, 'total_token_count', 0) or (
+            metadata["prompt_tokens"] +
+            metadata["output_tokens"] +
+            metadata["thought_tokens"]
+        )
         
         return metadata
     
+    def _row_from_response(
+        self,
+        response: GeneratedResponse,
+        costs: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Monta o registro da tabela llm_responses para uma resposta gerada
+        """
+        data = {
+            "email_id": response.email_id,
+            "response_type": response.response_type,
+            "suggested_subject": response.suggested_subject,
+            "suggested_body": response.suggested_body,
+            "tone": response.tone.value,
+            "tracking_data": response.tracking_included,
+            "approved": False,
+            "sent": False,
+            "confidence": response.confidence,
+            "reason": response.internal_notes
+        }
+        
+        # Adiciona custos se disponíveis
+        if costs:
+            data.update({
+                "cost_input_usd": costs["cost_input_usd"],
+                "cost_output_usd": costs["cost_output_usd"],
+                "cost_thinking_usd": costs["cost_thinking_usd"],
+                "cost_total_usd": costs["cost_total_usd"],
+                "cost_input_brl": costs["cost_input_brl"],
+                "cost_output_brl": costs["cost_output_brl"],
+                "cost_thinking_brl": costs["cost_thinking_brl"],
+                "cost_total_brl": costs["cost_total_brl"],
+                "exchange_rate": costs["exchange_rate"]
+            })
+        
+        return data
+    
     async def _save_to_database(
         self,
         response: GeneratedResponse,
@@ -410,36 +979,13 @@ class ResponseService:
         try:
             supabase = get_supabase()
             
-            # Prepara dados para inserção
-            data = {
-                "email_id": response.email_id,
-                "response_type": response.response_type,
-                "suggested_subject": response.suggested_subject,
-                "suggested_body": response.suggested_body,
-                "tone": response.tone.value,
-                "tracking_data": response.tracking_included,
-                "approved": False,
-                "sent": False,
-                "confidence": response.confidence,
-                "reason": response.internal_notes
-            }
-            
-            # Adiciona custos se disponíveis
-            if costs:
-                data.update({
-                    "cost_input_usd": costs["cost_input_usd"],
-                    "cost_output_usd": costs["cost_output_usd"],
-                    "cost_thinking_usd": costs["cost_thinking_usd"],
-                    "cost_total_usd": costs["cost_total_usd"],
-                    "cost_input_brl": costs["cost_input_brl"],
-                    "cost_output_brl": costs["cost_output_brl"],
-                    "cost_thinking_brl": costs["cost_thinking_brl"],
-                    "cost_total_brl": costs["cost_total_brl"],
-                    "exchange_rate": costs["exchange_rate"]
-                })
-            
-            # Insere nova resposta (permite múltiplas respostas por email para auditoria)
-            result = supabase.table("llm_responses").insert(data).execute()
+            # Insere nova resposta (permite múltiplas respostas por email para auditoria).
+            # O cliente Supabase é síncrono: roda em uma thread para não travar o event loop
+            await self._run_io(
+                supabase.table("llm_responses").insert(
+                    self._row_from_response(response, costs)
+                ).execute
+            )
             
             logger.info(f"Response saved to database for email {response.email_id}")
             
@@ -447,6 +993,27 @@ class ResponseService:
             logger.error(f"Failed to save response to database: {e}")
             raise
     
+    def _save_batch_to_database(self, responses: List[GeneratedResponse], rows: List[Dict[str, Any]]):
+        """
+        Salva as respostas de um lote no Supabase com inserts em lote
+        
+        Envia até SUPABASE_BATCH_INSERT_SIZE linhas por requisição e marca
+        saved_to_db nas respostas de cada lote salvo. Falhas são logadas.
+        """
+        supabase = get_supabase()
+        batch_size = settings.SUPABASE_BATCH_INSERT_SIZE
+        
+        for i in range(0, len(rows), batch_size):
+            try:
+                supabase.table("llm_responses").insert(rows[i:i + batch_size]).execute()
+                for response in responses[i:i + batch_size]:
+                    response.saved_to_db = True
+            except Exception as e:
+                logger.error(f"Failed to save {len(rows[i:i + batch_size])} batch response(s) to database: {e}")
+        
+        saved = sum(1 for response in responses if response.saved_to_db)
+        logger.info(f"{saved} batch response(s) saved to database")
+    
     async def generate_batch(
         self,
         requests: List[ResponseGenerationInput],
@@ -455,41 +1022,46 @@ class ResponseService:
         """
         Gera respostas para múltiplos e-mails em lote
         """
-        import asyncio
         start_time = time.time()
         
         responses = []
         successful = 0
         failed = 0
         
-        # Processa em paralelo com limite
-        MAX_CONCURRENT = 3  # Menos paralelo para geração de resposta
+        # Processa em paralelo com limite: assim que uma geração termina, a
+        # próxima começa (sem esperar a mais lenta de um grupo)
+        semaphore = asyncio.Semaphore(settings.RESPONSE_BATCH_MAX_CONCURRENT)
         
-        for i in range(0, len(requests), MAX_CONCURRENT):
-            batch = requests[i:i + MAX_CONCURRENT]
-            
-            # Processa batch em paralelo
-            batch_tasks = [
-                self.generate_response(req, save_to_db)
-                for req in batch
-            ]
-            
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-            
-            for result in batch_results:
-                if isinstance(result, Exception):
-                    failed += 1
-                    logger.error(f"Batch generation error: {result}")
+        async def _generate_one(req: ResponseGenerationInput):
+            async with semaphore:
+                return await self._generate_response(req)
+        
+        batch_results = await asyncio.gather(
+            *[_generate_one(req) for req in requests],
+            return_exceptions=True
+        )
+        
+        # Respostas geradas com sucesso são salvas juntas, no final do lote
+        to_save: List[GeneratedResponse] = []
+        rows: List[Dict[str, Any]] = []
+        
+        for result in batch_results:
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error(f"Batch generation error: {result}")
+            else:
+                generated, costs = result
+                responses.append(generated)
+                if not generated.error:
+                    successful += 1
+                    if save_to_db:
+                        to_save.append(generated)
+                        rows.append(self._row_from_response(generated, costs))
                 else:
-                    responses.append(result)
-                    if not result.error:
-                        successful += 1
-                    else:
-                        failed += 1
-            
-            # Delay entre batches
-            if i + MAX_CONCURRENT < len(requests):
-                await asyncio.sleep(1.0)
+                    failed += 1
+        
+        if rows:
+            await self._run_io(self._save_batch_to_database, to_save, rows)
         
         processing_time_ms = int((time.time() - start_time) * 1000)
         
@@ -5,8 +5,10 @@ Processamento inteligente de e-mails com Google Gemini
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import uvicorn
+import time
 from loguru import logger
 
 # Import local modules
@@ -20,6 +22,9 @@ from app.api.v1 import (
 from app.db.supabase import init_supabase
 from app.core.gemini import init_gemini_client
 from app.services.mysql_service import mysql_service
+from app.services.processing_service import processing_service
+from app.services.response_service import response_service
+from app.services.currency_service import currency_service
 
 # Configure logger
 logger.add(
@@ -27,7 +32,8 @@ logger.add(
     rotation="500 MB",
     retention="10 days",
     format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
-    level=settings.LOG_LEVEL
+    level=settings.LOG_LEVEL,
+    enqueue=True  # Escrita em disco numa thread separada, fora do event loop
 )
 
 
@@ -42,6 +48,9 @@ async def lifespan(app: FastAPI):
     # Inicializar conex�es
     await init_supabase()
     init_gemini_client()
+    response_service.start_metrics_flush()
+    # Taxa de câmbio atualizada em segundo plano (custos calculados sem await)
+    currency_service.start_refresh()
     
     # Inicializar MySQL
     try:
@@ -57,6 +66,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Encerrando XMX Email AI Backend...")
     
+    # Concluir salvamentos pendentes de e-mails processados
+    await processing_service.flush_pending_saves()
+    await response_service.close()
+    await currency_service.stop_refresh()
+    
     # Fechar conexão MySQL
     await mysql_service.close()
 
@@ -136,18 +150,24 @@ async def root():
 @app.exception_handler(ValueError)
 async def value_error_handler(request, exc):
     logger.error(f"ValueError: {exc}")
-    return {
-        "error": "Valor inv�lido",
-        "detail": str(exc)
-    }
+    return JSONResponse(
+        status_code=400,
+        content={
+            "error": "Valor inv�lido",
+            "detail": str(exc)
+        }
+    )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     logger.error(f"Erro n�o tratado: {exc}")
-    return {
-        "error": "Erro interno do servidor",
-        "detail": "Um erro inesperado ocorreu. Por favor, tente novamente."
-    }
+    return JSONResponse(
+        status_code=500,
+        content={
+            "error": "Erro interno do servidor",
+            "detail": "Um erro inesperado ocorreu. Por favor, tente novamente."
+        }
+    )
 
 # Middleware para logging de requests
 @app.middleware("http")
@@ -155,7 +175,6 @@ async def log_requests(request, call_next):
     """
     Log de todas as requisi��es
     """
-    import time
     start_time = time.time()
     
     response = await call_next(request)
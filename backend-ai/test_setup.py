@@ -5,147 +5,220 @@ Script para testar a configuração do backend
 
 import sys
 import os
-from pathlib import Path
+import argparse
+import importlib
+import importlib.util
+import functools
+from importlib import metadata
 
-# Adicionar o diretório raiz ao path
-sys.path.insert(0, str(Path(__file__).parent))
+# Adicionar o diretório raiz ao path (uma vez só, mesmo se o script for
+# importado de novo; realpath() normaliza caminhos via symlink)
+_HERE = os.path.dirname(os.path.realpath(__file__))
+if _HERE not in sys.path:
+    sys.path.insert(0, _HERE)
+
+# Marcadores e ícones: emoji só em terminal interativo; em pipes/CI usa
+# ASCII, que não depende da codificação do console
+_USE_EMOJI = sys.stdout.isatty()
+_OK, _FAIL, _WARN, _SKIP = ("✅", "❌", "⚠️ ", "⏭ ") if _USE_EMOJI else ("[OK]", "[FAIL]", "[WARN]", "[SKIP]")
+_TIP, _NOTE, _DONE, _READY = ("💡", "📝", "✨", "🎉") if _USE_EMOJI else ("[TIP]", "[NOTE]", "[OK]", "[OK]")
+_TITLE, _DEPS, _IMPORTS, _ENV, _SUMMARY = ("🚀", "📦", "🧪", "🔧", "📊") if _USE_EMOJI else ("==>",) * 5
+
+# Dependências verificadas: (módulo, nome exibido, distribuição para exibir a versão)
+_DEPENDENCIES = (
+    ("fastapi", "FastAPI", "fastapi"),
+    ("uvicorn", "Uvicorn", None),
+    ("google.genai", "Google GenAI", None),
+    ("supabase", "Supabase", None),
+    ("pydantic", "Pydantic", "pydantic"),
+    ("loguru", "Loguru", None),
+)
+
+# Módulos da aplicação: (módulo, nomes que devem existir, mensagem de sucesso)
+_APP_MODULES = (
+    ("app.core.config", ("settings",), "Config importado com sucesso"),
+    ("app.core.gemini", ("init_gemini_client",), "Gemini client importado com sucesso"),
+    ("app.core.security", ("create_access_token", "verify_api_key"), "Security importado com sucesso"),
+    ("app.models.email", ("EmailInput", "EmailBatch"), "Email models importados com sucesso"),
+    ("app.models.response", ("GeminiDecision", "EmailProcessingResult"), "Response models importados com sucesso"),
+    ("app.api.v1", ("emails_router", "health_router"), "API routers importados com sucesso"),
+    ("app.db.supabase", ("init_supabase",), "Supabase client importado com sucesso"),
+)
+
+# Variáveis críticas: (nome, valor de exemplo do .env.example que conta como não configurado)
+_CHECKS = (
+    ("API_KEY", "your-secure-api-key-here"),
+    ("SECRET_KEY", "your-secret-key-for-jwt-here"),
+    ("GEMINI_API_KEY", "your-gemini-api-key-here"),
+    ("SUPABASE_KEY", "your-supabase-service-key-here"),
+)
+
+@functools.lru_cache(maxsize=None)
+def _has(module_name):
+    """Indica se o módulo pode ser encontrado, sem executá-lo"""
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except ModuleNotFoundError:
+        # Pacote pai ausente (ex.: "google" para "google.genai")
+        return False
+
+def _emit(lines):
+    """Escreve as linhas de uma fase numa única escrita no stdout"""
+    sys.stdout.write("\n".join(lines) + "\n")
 
 def test_imports():
-    """Testa se todos os imports estão funcionando"""
-    print("🧪 Testando imports...")
+    """
+    Testa se todos os imports estão funcionando
+    
+    Retorna (ok, settings); settings é repassado para test_environment
+    """
+    lines = [f"{_IMPORTS} Testando imports..."]
     
+    settings = None
     try:
-        # Core imports
-        from app.core.config import settings
-        print("✅ Config importado com sucesso")
-        
-        from app.core.gemini import init_gemini_client
-        print("✅ Gemini client importado com sucesso")
-        
-        from app.core.security import create_access_token, verify_api_key
-        print("✅ Security importado com sucesso")
-        
-        # Model imports
-        from app.models.email import EmailInput, EmailBatch
-        print("✅ Email models importados com sucesso")
-        
-        from app.models.response import GeminiDecision, EmailProcessingResult
-        print("✅ Response models importados com sucesso")
-        
-        
-        # API imports
-        from app.api.v1 import emails_router, health_router
-        print("✅ API routers importados com sucesso")
-        
-        # DB imports
-        from app.db.supabase import init_supabase
-        print("✅ Supabase client importado com sucesso")
-        
-        print("\n✨ Todos os imports estão funcionando!")
-        return True
-        
-    except Exception as e:
-        print(f"\n❌ Erro ao importar: {e}")
-        return False
+        for module_name, names, message in _APP_MODULES:
+            module = importlib.import_module(module_name)
+            for name in names:
+                if not hasattr(module, name):
+                    raise ImportError(f"cannot import name '{name}' from '{module_name}'")
+            if module_name == "app.core.config":
+                settings = module.settings
+            lines.append(f"{_OK} {message}")
+        
+        lines.append(f"\n{_DONE} Todos os imports estão funcionando!")
+        return True, settings
+        
+    # ValueError cobre a validação do settings (ex.: .env ausente); outros
+    # erros são bugs e devem aparecer com traceback
+    except (ImportError, ValueError) as e:
+        lines.append(f"\n{_FAIL} Erro ao importar: {e}")
+        return False, settings
+    
+    finally:
+        _emit(lines)
 
-def test_environment():
-    """Testa se as variáveis de ambiente estão configuradas"""
-    print("\n🔧 Verificando variáveis de ambiente...")
+def test_environment(settings=None):
+    """
+    Testa se as variáveis de ambiente estão configuradas
+    
+    Usa o settings já carregado por test_imports, se houver
+    """
+    lines = [f"\n{_ENV} Verificando variáveis de ambiente..."]
     
     try:
-        from app.core.config import settings
-        
-        # Verificar variáveis críticas
-        missing = []
-        
-        if not settings.API_KEY or settings.API_KEY == "your-secure-api-key-here":
-            missing.append("API_KEY")
-        
-        if not settings.SECRET_KEY or settings.SECRET_KEY == "your-secret-key-for-jwt-here":
-            missing.append("SECRET_KEY")
-            
-        if not settings.GEMINI_API_KEY or settings.GEMINI_API_KEY == "your-gemini-api-key-here":
-            missing.append("GEMINI_API_KEY")
-            
-        if not settings.SUPABASE_KEY or settings.SUPABASE_KEY == "your-supabase-service-role-key-here":
-            missing.append("SUPABASE_KEY")
+        if settings is None:
+            try:
+                from app.core.config import settings
+            except (ImportError, ValueError) as e:
+                lines.append(f"\n{_FAIL} Erro ao verificar ambiente: {e}")
+                return False
+        
+        # Verificar variáveis críticas (ausentes, vazias ou com o valor de exemplo)
+        missing = [
+            name for name, placeholder in _CHECKS
+            if getattr(settings, name, None) in (None, "", placeholder)
+        ]
         
         if missing:
-            print(f"\n⚠️  Variáveis de ambiente faltando ou com valores padrão:")
+            lines.append(f"\n{_WARN} Variáveis de ambiente faltando ou com valores padrão:")
             for var in missing:
-                print(f"   - {var}")
-            print(f"\n📝 Configure essas variáveis no arquivo .env na raiz do projeto")
-            print(f"   Consulte INSTRUCOES_CHAVES_API.md para obter as chaves")
+                lines.append(f"   - {var}")
+            lines.append(f"\n{_NOTE} Configure essas variáveis no arquivo .env na raiz do projeto")
+            lines.append(f"   Consulte INSTRUCOES_CHAVES_API.md para obter as chaves")
             return False
         else:
-            print("✅ Todas as variáveis de ambiente estão configuradas!")
+            lines.append(f"{_OK} Todas as variáveis de ambiente estão configuradas!")
             return True
-            
-    except Exception as e:
-        print(f"\n❌ Erro ao verificar ambiente: {e}")
-        return False
+    
+    finally:
+        _emit(lines)
 
 def test_dependencies():
     """Testa se todas as dependências estão instaladas"""
-    print("\n📦 Verificando dependências...")
+    lines = [f"\n{_DEPS} Verificando dependências..."]
     
+    # find_spec só localiza o módulo (sem executá-lo) e a versão vem dos
+    # metadados do pacote, sem importar FastAPI/GenAI/Supabase inteiros
     try:
-        import fastapi
-        print(f"✅ FastAPI {fastapi.__version__}")
-        
-        import uvicorn
-        print("✅ Uvicorn instalado")
-        
-        import google.genai
-        print("✅ Google GenAI instalado")
-        
-        import supabase
-        print("✅ Supabase instalado")
-        
-        import pydantic
-        print(f"✅ Pydantic {pydantic.__version__}")
-        
-        import loguru
-        print("✅ Loguru instalado")
-        
-        print("\n✨ Todas as dependências estão instaladas!")
+        for module_name, label, distribution in _DEPENDENCIES:
+            if not _has(module_name):
+                lines.append(f"\n{_FAIL} Dependência faltando: No module named '{module_name}'")
+                lines.append(f"\n{_TIP} Execute: pip install -r requirements.txt")
+                return False
+            if distribution:
+                lines.append(f"{_OK} {label} {metadata.version(distribution)}")
+            else:
+                lines.append(f"{_OK} {label} instalado")
+        
+        lines.append(f"\n{_DONE} Todas as dependências estão instaladas!")
         return True
-        
-    except ImportError as e:
-        print(f"\n❌ Dependência faltando: {e}")
-        print("\n💡 Execute: pip install -r requirements.txt")
+    
+    except metadata.PackageNotFoundError as e:
+        # Módulo presente mas sem metadados de distribuição (instalação quebrada)
+        lines.append(f"\n{_FAIL} Pacote sem metadados: {e}")
+        lines.append(f"\n{_TIP} Execute: pip install -r requirements.txt")
         return False
+    
+    finally:
+        _emit(lines)
 
-def main():
+def _status(ok):
+    """Texto do resumo para o resultado de uma fase (None = fase não executada)"""
+    if ok is None:
+        return f"{_SKIP} PULADO"
+    return f"{_OK} OK" if ok else f"{_FAIL} FALHOU"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Testa a configuração do backend")
+    parser.add_argument("--deps", action="store_true", help="verifica só as dependências")
+    parser.add_argument("--imports", action="store_true", help="verifica só os imports da aplicação")
+    parser.add_argument("--env", action="store_true", help="verifica só as variáveis de ambiente")
+    args = parser.parse_args(argv)
+    # Sem flags, executa todas as fases
+    run_all = not (args.deps or args.imports or args.env)
+    
+    # Fora de terminal, caracteres que a codificação do console não suporta
+    # (ex.: acentos com PYTHONIOENCODING=ascii) viram "?" em vez de derrubar o script
+    if not _USE_EMOJI and hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(errors="replace")
+    
     print("=" * 50)
-    print("🚀 XMX Email AI Backend - Teste de Configuração")
+    print(f"{_TITLE} XMX Email AI Backend - Teste de Configuração")
     print("=" * 50)
     
-    # Executar testes
-    deps_ok = test_dependencies()
-    imports_ok = test_imports()
-    env_ok = test_environment()
+    # Executar testes (cada fase só importa o que usa)
+    deps_ok = test_dependencies() if run_all or args.deps else None
+    if deps_ok is False:
+        # Com dependência faltando, imports e ambiente falhariam pelo mesmo
+        # motivo: as fases seguintes aparecem como puladas no resumo
+        imports_ok, env_ok = None, None
+    else:
+        imports_ok, settings = test_imports() if run_all or args.imports else (None, None)
+        env_ok = test_environment(settings) if run_all or args.env else None
     
     print("\n" + "=" * 50)
-    print("📊 Resumo dos Testes:")
+    print(f"{_SUMMARY} Resumo dos Testes:")
     print("=" * 50)
     
-    print(f"Dependências: {'✅ OK' if deps_ok else '❌ FALHOU'}")
-    print(f"Imports:      {'✅ OK' if imports_ok else '❌ FALHOU'}")
-    print(f"Environment:  {'✅ OK' if env_ok else '❌ FALHOU'}")
+    print(f"Dependências: {_status(deps_ok)}")
+    print(f"Imports:      {_status(imports_ok)}")
+    print(f"Environment:  {_status(env_ok)}")
     
-    if deps_ok and imports_ok:
+    # Na execução completa, chaves faltando não impedem o backend de subir;
+    # com --env, a verificação pedida é justamente a do ambiente
+    failed = deps_ok is False or imports_ok is False or (not run_all and env_ok is False)
+    if failed:
+        print(f"\n{_FAIL} Corrija os erros acima antes de executar o backend")
+    elif run_all:
         if env_ok:
-            print("\n🎉 Backend está pronto para executar!")
-            print("\n💡 Para iniciar o servidor:")
+            print(f"\n{_READY} Backend está pronto para executar!")
+            print(f"\n{_TIP} Para iniciar o servidor:")
             print("   python main.py")
         else:
-            print("\n⚠️  Backend está configurado, mas faltam as chaves de API")
+            print(f"\n{_WARN} Backend está configurado, mas faltam as chaves de API")
             print("   Configure as variáveis no arquivo .env primeiro")
-    else:
-        print("\n❌ Corrija os erros acima antes de executar o backend")
     
-    return 0 if (deps_ok and imports_ok) else 1
+    return 1 if failed else 0
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+Testes do salvamento em lote do serviço de classificação
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services import classification_service as classification_module
+from app.services.classification_service import ClassificationService
+
+
+class _FakeSupabase:
+    """Cliente Supabase mínimo: registra cada upsert e falha nos lotes pedidos"""
+
+    def __init__(self, fail_batches=()):
+        self.upserts = []
+        self.fail_batches = set(fail_batches)
+
+    def table(self, name):
+        return self
+
+    def upsert(self, rows, on_conflict):
+        self.upserts.append(rows)
+        return self
+
+    def execute(self):
+        if len(self.upserts) - 1 in self.fail_batches:
+            raise RuntimeError("supabase indisponível")
+
+
+def _batch(*email_ids):
+    rows = [{"email_id": email_id, "seq": i} for i, email_id in enumerate(email_ids)]
+    results = [SimpleNamespace(saved_to_db=False) for _ in email_ids]
+    return results, rows
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    def install(**kwargs):
+        client = _FakeSupabase(**kwargs)
+        monkeypatch.setattr(classification_module, "get_supabase", lambda: client)
+        return client
+
+    return install
+
+
+def test_save_batch_keeps_last_classification_per_email(supabase):
+    client = supabase()
+    results, rows = _batch("a", "b", "a")
+
+    ClassificationService()._save_batch_to_database(results, rows)
+
+    # Um único upsert, sem email_id repetido, com a última linha de "a"
+    assert client.upserts == [[{"email_id": "b", "seq": 1}, {"email_id": "a", "seq": 2}]]
+    assert [r.saved_to_db for r in results] == [False, True, True]
+
+
+def test_save_batch_is_split_into_chunks(supabase, monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_BATCH_INSERT_SIZE", 2)
+    client = supabase(fail_batches={1})
+    results, rows = _batch("a", "b", "c", "d", "e")
+
+    ClassificationService()._save_batch_to_database(results, rows)
+
+    assert [len(chunk) for chunk in client.upserts] == [2, 2, 1]
+    # Só as linhas do lote que falhou ficam sem saved_to_db
+    assert [r.saved_to_db for r in results] == [True, True, False, False, True]
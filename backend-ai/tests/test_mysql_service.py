@@ -0,0 +1,306 @@
+"""
+Testes das consultas e da reconexão do serviço MySQL
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime
+
+import aiomysql
+import pytest
+
+from app.core.config import settings
+from app.models.tracking import TrackingQueryInput
+from app.services.mysql_service import MySQLService, mysql_retry
+
+
+class _FakeCursor:
+    """Cursor mínimo: registra a query e devolve as linhas configuradas
+
+    Cada execute levanta o próximo erro de errors, se houver.
+    """
+
+    def __init__(self, rows, errors=()):
+        self.rows = rows
+        self.errors = list(errors)
+        self.executed = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params):
+        self.executed.append((query, params))
+        if self.errors:
+            raise self.errors.pop(0)
+
+    async def fetchall(self):
+        return self.rows
+
+
+class _FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def cursor(self, *args):
+        return self._cursor
+
+
+class _FakePool:
+    def __init__(self, rows, errors=()):
+        self.cursor = _FakeCursor(rows, errors)
+        self.closed = False
+
+    def acquire(self):
+        return _FakeConnection(self.cursor)
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+def _order_row(email, order_id, day):
+    return {
+        'order_id_cartpanda': order_id,
+        'order': order_id,
+        'tracking': f"BR{order_id}BR",
+        'purchase_date': datetime(2025, 1, day),
+        'country': 'Brasil',
+        'status_id': 'shipped',
+        'email_client': email,
+    }
+
+
+def _service(rows):
+    service = MySQLService()
+    service.pool = _FakePool(rows)
+    return service
+
+
+def _gone_away():
+    return aiomysql.OperationalError(2006, "MySQL server has gone away")
+
+
+def _reconnecting_service(monkeypatch, pool, *new_pools):
+    """Serviço cujo initialize() instala os próximos pools e conta as chamadas"""
+    service = MySQLService()
+    service.pool = pool
+    service.initialize_calls = 0
+    pending = list(new_pools)
+
+    async def initialize():
+        service.initialize_calls += 1
+        # Cede o loop para que reconexões concorrentes se intercalem
+        await asyncio.sleep(0)
+        service.pool = pending.pop(0)
+
+    monkeypatch.setattr(service, "initialize", initialize)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_find_tracking_by_emails_groups_case_insensitively():
+    # Linhas já na ordem do ORDER BY email_client, purchase_date DESC
+    service = _service([
+        _order_row("cliente@x.com", "1002", 2),
+        _order_row("Cliente@x.com", "1001", 1),
+        _order_row("outro@x.com", "2001", 1),
+    ])
+
+    trackings = await service.find_tracking_by_emails(
+        ["Cliente@x.com", "cliente@x.com", "outro@x.com"],
+        limit_per_email=5
+    )
+
+    assert set(trackings) == {"cliente@x.com", "outro@x.com"}
+    assert [t.order_id for t in trackings["cliente@x.com"]] == ["1002", "1001"]
+    # Todas as grafias distintas vão para o IN, sem repetição
+    _, params = service.pool.cursor.executed[0]
+    assert params == ("Cliente@x.com", "cliente@x.com", "outro@x.com")
+
+
+@pytest.mark.asyncio
+async def test_find_tracking_by_emails_merges_split_runs():
+    # Collation binária: grafias do mesmo e-mail não ficam adjacentes no ORDER BY
+    service = _service([
+        _order_row("Cliente@x.com", "1001", 1),
+        _order_row("Outro@x.com", "2001", 1),
+        _order_row("cliente@x.com", "1003", 3),
+        _order_row("cliente@x.com", "1002", 2),
+    ])
+
+    trackings = await service.find_tracking_by_emails(
+        ["Cliente@x.com", "cliente@x.com", "outro@x.com"],
+        limit_per_email=2
+    )
+
+    # Nenhuma linha é perdida e os mais recentes vêm primeiro
+    assert [t.order_id for t in trackings["cliente@x.com"]] == ["1003", "1002"]
+    assert [t.order_id for t in trackings["outro@x.com"]] == ["2001"]
+
+
+@pytest.mark.asyncio
+async def test_find_tracking_by_emails_respects_limit_per_email():
+    service = _service([
+        _order_row("cliente@x.com", "1003", 3),
+        _order_row("cliente@x.com", "1002", 2),
+        _order_row("cliente@x.com", "1001", 1),
+    ])
+
+    trackings = await service.find_tracking_by_emails(["cliente@x.com"])
+
+    assert [t.order_id for t in trackings["cliente@x.com"]] == ["1003"]
+
+
+@pytest.mark.asyncio
+async def test_find_tracking_by_emails_empty_input_skips_query():
+    service = _service([])
+
+    assert await service.find_tracking_by_emails([]) == {}
+    assert service.pool.cursor.executed == []
+
+
+@pytest.mark.asyncio
+async def test_query_tracking_batch_maps_every_spelling():
+    service = _service([_order_row("cliente@x.com", "1001", 1)])
+
+    results = await service.query_tracking_batch([
+        TrackingQueryInput(email_id="a", sender_email="Cliente@x.com"),
+        TrackingQueryInput(email_id="b", sender_email="cliente@x.com"),
+        TrackingQueryInput(email_id="c", sender_email="semrastreio@x.com"),
+    ])
+
+    assert [r.email_id for r in results] == ["a", "b", "c"]
+    assert [r.found for r in results] == [True, True, False]
+    assert results[0].tracking_data.order_id == "1001"
+    assert results[2].suggestions
+
+
+@pytest.mark.asyncio
+async def test_find_all_trackings_retries_stale_connection(monkeypatch):
+    monkeypatch.setattr(settings, "MYSQL_RETRY_MAX_DELAY", 0)
+    stale = _FakePool([], errors=[_gone_away()])
+    fresh = _FakePool([_order_row("cliente@x.com", "1001", 1)])
+    service = _reconnecting_service(monkeypatch, stale, fresh)
+
+    trackings = await service.find_all_trackings_by_email("cliente@x.com")
+
+    # A conexão morta não vira "nenhum pedido": o pool é refeito e a busca repetida
+    assert [t.order_id for t in trackings] == ["1001"]
+    assert stale.closed
+    assert service.pool is fresh
+
+
+@pytest.mark.asyncio
+async def test_concurrent_failures_rebuild_pool_once(monkeypatch):
+    # Sem intervalo mínimo: quem evita a segunda reconexão é a dupla checagem
+    monkeypatch.setattr(settings, "MYSQL_RECONNECT_MIN_INTERVAL", 0)
+    stale = _FakePool([])
+    fresh = _FakePool([])
+    service = _reconnecting_service(monkeypatch, stale, fresh)
+
+    await asyncio.gather(
+        service._reconnect_pool(stale),
+        service._reconnect_pool(stale),
+    )
+
+    assert service.initialize_calls == 1
+    assert stale.closed
+    assert service.pool is fresh
+    assert not fresh.closed
+
+
+@pytest.mark.asyncio
+async def test_stale_pool_reference_keeps_fresh_pool(monkeypatch):
+    monkeypatch.setattr(settings, "MYSQL_RECONNECT_MIN_INTERVAL", 0)
+    stale = _FakePool([])
+    fresh = _FakePool([])
+    service = _reconnecting_service(monkeypatch, fresh)
+
+    # Falha observada em um pool que outra tarefa já substituiu
+    await service._reconnect_pool(stale)
+
+    assert service.initialize_calls == 0
+    assert service.pool is fresh
+    assert not fresh.closed
+
+
+@pytest.mark.asyncio
+async def test_reconnect_skipped_within_min_interval(monkeypatch):
+    monkeypatch.setattr(settings, "MYSQL_RECONNECT_MIN_INTERVAL", 60)
+    current = _FakePool([])
+    service = _reconnecting_service(monkeypatch, current, _FakePool([]))
+    service._last_reconnect_ts = time.monotonic()
+
+    await service._reconnect_pool(current)
+
+    assert service.initialize_calls == 0
+    assert service.pool is current
+
+
+@pytest.mark.asyncio
+async def test_closed_pool_is_rebuilt_within_min_interval(monkeypatch):
+    monkeypatch.setattr(settings, "MYSQL_RECONNECT_MIN_INTERVAL", 60)
+    current = _FakePool([])
+    current.closed = True
+    fresh = _FakePool([])
+    service = _reconnecting_service(monkeypatch, current, fresh)
+    service._last_reconnect_ts = time.monotonic()
+
+    await service._reconnect_pool(current)
+
+    assert service.initialize_calls == 1
+    assert service.pool is fresh
+
+
+@pytest.fixture
+def recorded_sleeps(monkeypatch):
+    """Registra as esperas do backoff sem dormir de verdade"""
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return sleeps
+
+
+async def _retry_until_exhausted(attempts):
+    @mysql_retry(max_attempts=attempts, delay=1.0)
+    async def always_gone():
+        raise aiomysql.OperationalError(2013, "Lost connection to MySQL server")
+
+    with pytest.raises(aiomysql.OperationalError):
+        await always_gone()
+
+
+@pytest.mark.asyncio
+async def test_retry_backoff_never_exceeds_cap(monkeypatch, recorded_sleeps):
+    monkeypatch.setattr(settings, "MYSQL_RETRY_MAX_DELAY", 2.0)
+
+    await _retry_until_exhausted(8)
+
+    assert len(recorded_sleeps) == 7
+    assert all(0 < delay <= 2.0 for delay in recorded_sleeps)
+
+
+@pytest.mark.asyncio
+async def test_retry_backoff_worst_case_jitter_is_capped(monkeypatch, recorded_sleeps):
+    monkeypatch.setattr(settings, "MYSQL_RETRY_MAX_DELAY", 2.0)
+    # Jitter sempre no limite superior (base * 1.5)
+    monkeypatch.setattr(random, "uniform", lambda low, high: high)
+
+    await _retry_until_exhausted(5)
+
+    assert recorded_sleeps == [1.5, 2.0, 2.0, 2.0]
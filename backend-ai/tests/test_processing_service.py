@@ -0,0 +1,162 @@
+"""
+Testes do serviço de processamento de e-mails
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services import processing_service as processing_module
+from app.services.processing_service import ProcessingService, processing_service
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Padrão de maior prioridade vence, mesmo aparecendo depois no texto
+    ("Código: ABCDEFGH12 referente ao pedido 12345", "12345"),
+    ("Rastreamento: XYZ78901 order #54321", "54321"),
+    ("Número 123456789 e código: ABCDEFGH12", "ABCDEFGH12"),
+    # Palavras-chave ignoram maiúsculas; o resultado sai em maiúsculas
+    ("PEDIDO #12345", "12345"),
+    ("rastreamento: abcdefgh", "ABCDEFGH"),
+    # Dentro do mesmo padrão, vence o match mais à esquerda
+    ("pedido 11111 e pedido 22222", "11111"),
+    ("Olá, tudo bem com a entrega?", None),
+    ("curto", None),
+])
+def test_extract_order_id_priority(text, expected):
+    assert processing_service._extract_order_id_from_text(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Um match de baixa prioridade (p4/p6) não pode engolir o início de um
+    # match de alta prioridade que se sobrepõe a ele
+    ("Meupedido 12345", "12345"),
+    ("ABCDEFGHpedido 12345", "12345"),
+    ("Meuorder 55555", "55555"),
+    ("0order123456789", "123456789"),
+    ("Rastreamento: pedido 12345", "12345"),
+])
+def test_extract_order_id_overlapping_matches(text, expected):
+    assert processing_service._extract_order_id_from_text(text) == expected
+
+
+@pytest.fixture
+def mysql_lookups(monkeypatch):
+    """Substitui a busca no MySQL e registra os e-mails consultados
+
+    "semrastreio@..." não tem pedidos ([]) e "erro@..." levanta a exceção que
+    find_all_trackings_by_email repassa quando o MySQL falha.
+    """
+    calls = []
+
+    async def find_all_trackings_by_email(email, limit=5):
+        calls.append(email)
+        if email.startswith("erro"):
+            raise RuntimeError("MySQL indisponível")
+        if email.startswith("semrastreio"):
+            return []
+        return [SimpleNamespace(
+            order_id="1001",
+            tracking_code="BR1001BR",
+            last_update=datetime(2025, 1, 1),
+            status=None
+        )]
+
+    monkeypatch.setattr(
+        processing_module.mysql_service, "find_all_trackings_by_email", find_all_trackings_by_email
+    )
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_search_tracking_reuses_recent_lookup(mysql_lookups):
+    service = ProcessingService()
+
+    first = await service._search_tracking("Cliente@x.com")
+    second = await service._search_tracking("cliente@x.com")
+
+    # A chave do cache ignora maiúsculas no e-mail
+    assert first.found
+    assert second is first
+    assert mysql_lookups == ["Cliente@x.com"]
+
+
+@pytest.mark.asyncio
+async def test_search_tracking_expired_entry_queries_again(mysql_lookups, monkeypatch):
+    monkeypatch.setattr(settings, "TRACKING_CACHE_TTL", 0)
+    service = ProcessingService()
+
+    await service._search_tracking("cliente@x.com")
+    await service._search_tracking("cliente@x.com")
+
+    assert len(mysql_lookups) == 2
+
+
+@pytest.mark.asyncio
+async def test_search_tracking_does_not_cache_not_found(mysql_lookups):
+    service = ProcessingService()
+
+    first = await service._search_tracking("semrastreio@x.com")
+    await service._search_tracking("semrastreio@x.com")
+
+    assert not first.found
+    assert not first.error
+    assert len(mysql_lookups) == 2
+
+
+@pytest.mark.asyncio
+async def test_search_tracking_does_not_cache_errors(mysql_lookups):
+    service = ProcessingService()
+
+    first = await service._search_tracking("erro@x.com")
+    await service._search_tracking("erro@x.com")
+
+    assert first.error
+    assert len(mysql_lookups) == 2
+
+
+@pytest.fixture
+def supabase_saves(monkeypatch):
+    """Substitui os inserts no Supabase; falham os lotes/registros em failing"""
+    saves = SimpleNamespace(emails=[], tracking=[], failing=set())
+
+    def save_processed_email(data):
+        ids = tuple(r["email_id"] for r in data) if isinstance(data, list) else data["email_id"]
+        if ids in saves.failing:
+            raise RuntimeError("insert falhou")
+        saves.emails.append(ids)
+
+    def save_tracking_requests(data):
+        saves.tracking.append(len(data))
+
+    monkeypatch.setattr(processing_module, "save_processed_email", save_processed_email)
+    monkeypatch.setattr(processing_module, "save_tracking_requests", save_tracking_requests)
+    monkeypatch.setattr(settings, "SUPABASE_BATCH_INSERT_SIZE", 2)
+    return saves
+
+
+def _email_records(*email_ids):
+    return [{"email_id": email_id} for email_id in email_ids]
+
+
+def test_save_records_failed_chunk_falls_back_to_single_inserts(supabase_saves):
+    # O lote (c, d) falha; no registro a registro, só c falha de novo
+    supabase_saves.failing = {("c", "d"), "c"}
+
+    ProcessingService()._save_records(_email_records("a", "b", "c", "d", "e"), [{"email_id": "a"}])
+
+    # d é salvo individualmente e o lote seguinte (e) e o rastreamento seguem
+    assert supabase_saves.emails == [("a", "b"), "d", ("e",)]
+    assert supabase_saves.tracking == [1]
+
+
+def test_save_records_failed_single_record_chunk_does_not_stop_the_rest(supabase_saves, monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_BATCH_INSERT_SIZE", 1)
+    supabase_saves.failing = {("a",)}
+
+    ProcessingService()._save_records(_email_records("a", "b"), [{"email_id": "a"}, {"email_id": "b"}])
+
+    assert supabase_saves.emails == [("b",)]
+    assert supabase_saves.tracking == [1, 1]
@@ -0,0 +1,230 @@
+"""
+Testes do serviço de respostas
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors as genai_errors
+
+from app.core.config import settings
+from app.models.response_generation import ResponseGenerationInput
+from app.services import response_service as response_module
+from app.services.response_service import (
+    ResponseService,
+    _TRUNCATED_MARKER,
+    _is_context_cache_miss,
+    _trim_email_body
+)
+
+
+def _client_error(code, status, message):
+    return genai_errors.ClientError(
+        code, {"error": {"code": code, "status": status, "message": message}}
+    )
+
+
+_CACHE_NOT_FOUND = _client_error(404, "NOT_FOUND", "CachedContent not found (or permission denied)")
+_CACHE_EXPIRED = _client_error(400, "INVALID_ARGUMENT", "Cached content is expired")
+_RATE_LIMITED = _client_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted")
+_BAD_REQUEST = _client_error(400, "INVALID_ARGUMENT", "Request contains an invalid argument")
+
+_RESPONSE_JSON = json.dumps({
+    "subject": "Re: Dúvida",
+    "body": "Olá! Segue a resposta.",
+    "tone": "professional",
+    "priority_actions": [],
+})
+
+
+class _FakeGemini:
+    """Cliente Gemini mínimo: cria caches e falha a primeira chamada com cache"""
+
+    def __init__(self, cache_error, delay=0.0):
+        self.cache_error = cache_error
+        self.delay = delay
+        self.calls = []
+        self.aio = SimpleNamespace(
+            caches=SimpleNamespace(create=self._create_cache),
+            models=SimpleNamespace(generate_content=self._generate_content),
+        )
+
+    async def _create_cache(self, model, config):
+        return SimpleNamespace(name=f"cachedContents/{len(self.calls)}")
+
+    async def _generate_content(self, model, contents, config):
+        self.calls.append(config.cached_content)
+        await asyncio.sleep(self.delay)
+        if config.cached_content and self.cache_error is not None:
+            raise self.cache_error
+        return SimpleNamespace(text=_RESPONSE_JSON, candidates=None, usage_metadata=None)
+
+
+def _request(email_id="msg_1"):
+    return ResponseGenerationInput(
+        email_id=email_id,
+        email_content={"from": "cliente@example.com", "subject": "Dúvida", "body": "Tem garantia?"},
+        classification={"is_support": True},
+    )
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "ENABLE_RESPONSE_CACHE", False)
+
+    def install(cache_error=None, delay=0.0):
+        client = _FakeGemini(cache_error, delay)
+        monkeypatch.setattr(response_module, "get_gemini_client", lambda: client)
+        return client
+
+    return install
+
+
+@pytest.mark.parametrize("error, expected", [
+    (_CACHE_NOT_FOUND, True),
+    (_CACHE_EXPIRED, True),
+    (_RATE_LIMITED, False),
+    (_BAD_REQUEST, False),
+    (TimeoutError("timed out"), False),
+])
+def test_is_context_cache_miss(error, expected):
+    assert _is_context_cache_miss(error) is expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [_CACHE_NOT_FOUND, _CACHE_EXPIRED])
+async def test_cache_miss_falls_back_to_inline_prompt(gemini, error):
+    client = gemini(error)
+    service = ResponseService()
+
+    generated = await service.generate_response(_request(), save_to_db=False)
+
+    assert generated.suggested_body == "Olá! Segue a resposta."
+    # Primeira chamada com o cache, a segunda com o prompt inline
+    assert client.calls[0] is not None
+    assert client.calls[1] is None
+    # O cache inválido é descartado para ser recriado na próxima chamada
+    assert service._context_caches == {}
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_raised_without_dropping_cache(gemini):
+    client = gemini(_RATE_LIMITED)
+    service = ResponseService()
+
+    with pytest.raises(genai_errors.ClientError):
+        await service.generate_response(_request(), save_to_db=False)
+
+    assert len(client.calls) == 1
+    assert service._context_caches
+
+
+@pytest.mark.asyncio
+async def test_io_pool_is_recreated_after_close():
+    service = ResponseService()
+
+    assert await service._run_io(sum, (1, 2)) == 3
+    await service.close()
+    # Um novo ciclo de lifespan (ex.: outro TestClient) volta a usar o serviço
+    assert await service._run_io(sum, (3, 4)) == 7
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_identical_generations_in_flight_share_one_call(gemini, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "ENABLE_RESPONSE_CACHE", True)
+    client = gemini(delay=0.05)
+    service = ResponseService()
+
+    first, second = await asyncio.gather(
+        service.generate_response(_request("msg_1"), save_to_db=False),
+        service.generate_response(_request("msg_2"), save_to_db=False),
+    )
+
+    assert len(client.calls) == 1
+    assert (first.email_id, second.email_id) == ("msg_1", "msg_2")
+    assert second.suggested_body == first.suggested_body
+    # A cópia não consumiu tokens
+    assert second.total_tokens == 0
+    assert service._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_in_flight_lets_waiter_retry(gemini, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "ENABLE_RESPONSE_CACHE", True)
+    # Sem fallback inline: a primeira chamada falha e quem aguardava refaz a sua
+    client = gemini(_RATE_LIMITED, delay=0.05)
+    service = ResponseService()
+
+    first, second = await asyncio.gather(
+        service.generate_response(_request("msg_1"), save_to_db=False),
+        service.generate_response(_request("msg_2"), save_to_db=False),
+        return_exceptions=True,
+    )
+
+    assert isinstance(first, genai_errors.ClientError)
+    assert isinstance(second, genai_errors.ClientError)
+    assert len(client.calls) == 2
+    assert service._inflight == {}
+
+
+def test_trim_email_body_drops_quoted_history():
+    body = (
+        "Meu pedido não chegou.\n"
+        "\n"
+        "Em seg., 6 de jan. de 2025 às 10:00, Loja <loja@example.com> escreveu:\n"
+        "> Seu pedido foi enviado.\n"
+    )
+
+    assert _trim_email_body(body, 8000) == "Meu pedido não chegou."
+
+
+def test_trim_email_body_drops_quoted_lines():
+    body = "> resposta antiga\nTexto novo\n  > mais citação"
+
+    assert _trim_email_body(body, 8000) == "Texto novo"
+
+
+def test_trim_email_body_keeps_fully_quoted_body():
+    body = "> só citação"
+
+    assert _trim_email_body(body, 8000) == body
+
+
+def test_trim_email_body_cuts_at_word_boundary():
+    body = "palavra " * 20
+
+    trimmed = _trim_email_body(body, 30)
+
+    assert trimmed.endswith(_TRUNCATED_MARKER)
+    kept = trimmed[:-len(_TRUNCATED_MARKER)]
+    assert len(kept) <= 30
+    assert kept == kept.rstrip()
+    assert all(word == "palavra" for word in kept.split(" "))
+
+
+@pytest.mark.asyncio
+async def test_recent_response_is_reused_until_it_expires(gemini, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "ENABLE_RESPONSE_CACHE", True)
+    client = gemini()
+    service = ResponseService()
+
+    await service.generate_response(_request("msg_1"), save_to_db=False)
+    reused = await service.generate_response(_request("msg_2"), save_to_db=False)
+
+    assert len(client.calls) == 1
+    assert reused.email_id == "msg_2"
+
+    # Entrada expirada: a próxima chamada volta a gerar com o Gemini
+    monkeypatch.setattr(settings, "CACHE_TTL", 0)
+    service._response_cache.clear()
+    await service.generate_response(_request("msg_3"), save_to_db=False)
+    await service.generate_response(_request("msg_4"), save_to_db=False)
+
+    assert len(client.calls) == 3